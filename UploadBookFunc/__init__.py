@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import json
@@ -6,9 +7,10 @@ from typing import Dict, Any
 import fitz  # PyMuPDF
 import requests
 from azure.functions import HttpRequest, HttpResponse
-from azure.storage.blob import BlobServiceClient
 from azure.core.exceptions import AzureError
 
+from shared_code.blob_clients import get_blob_service_client
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,7 +29,7 @@ METADATA_API_URL = os.getenv("METADATA_API_URL")
 CHUNKING_URL = os.getenv("CHUNKING_URL")
 API_KEY = os.getenv("API_KEY")
 
-def main(req: HttpRequest) -> HttpResponse:
+async def main(req: HttpRequest) -> HttpResponse:
     logger.info('Processing HTTP request in Azure Function.')
 
     if req.method == 'OPTIONS':
@@ -40,7 +42,7 @@ def main(req: HttpRequest) -> HttpResponse:
         if not connect_str:
             raise ValueError("Azure Storage connection string is not set.")
         
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+        blob_service_client = get_blob_service_client(connect_str)
         container_client = blob_service_client.get_container_client(CONTAINER_NAME)
         logger.info(f"Connected to Azure Blob Storage container: {CONTAINER_NAME}")
 
@@ -53,7 +55,8 @@ def main(req: HttpRequest) -> HttpResponse:
             return create_response("error", "Uploaded file is not a PDF.", 400)
 
         file_content = file.read()
-        pdf_text = extract_pdf_text(file_content)
+        # Blockierende Schritte laufen in Threads, damit die Event-Loop frei bleibt
+        pdf_text = await asyncio.to_thread(extract_pdf_text, file_content)
         
         if not pdf_text.strip():
             return create_response("error", "Uploaded PDF does not contain text. Please perform OCR.", 400)
@@ -62,19 +65,19 @@ def main(req: HttpRequest) -> HttpResponse:
         book_data = process_book_metadata(req)
         
         # Check for existing file
-        if file_exists(file_name):
+        if await asyncio.to_thread(file_exists, file_name):
             return create_response("error", "This file has already been uploaded.", 400)
 
         # Upload file to Blob Storage
         blob_client = container_client.get_blob_client(file_name)
-        blob_client.upload_blob(file_content, overwrite=True)
+        await blob_client.upload_blob(file_content, overwrite=True)
         logger.info(f"File uploaded successfully: {file_name}")
 
         # Save metadata and get book ID
-        book_id = save_metadata(book_data, file_name)
+        book_id = await asyncio.to_thread(save_metadata, book_data, file_name)
         
         # Initiate chunking process
-        initiate_chunking(book_id)
+        await asyncio.to_thread(initiate_chunking, book_id)
 
         logger.info(f"File processing completed successfully for: {file_name}")
         return create_response("success", f"File {file_name} uploaded successfully to container {CONTAINER_NAME}, metadata saved, and chunking process initiated.", 200, book_id)
@@ -104,11 +107,11 @@ def create_response(status: str, message: str, status_code: int, return_val: Any
 def extract_pdf_text(file_content: bytes) -> str:
     logger.info("Extracting text from PDF")
     pdf_document = fitz.open(stream=file_content, filetype="pdf")
-    pdf_text = ""
+    page_texts = []
     for page_num, page in enumerate(pdf_document):
-        pdf_text += page.get_text()
+        page_texts.append(page.get_text())
         logger.debug(f"Extracted text from page {page_num + 1}")
-    return pdf_text
+    return "".join(page_texts)
 
 def process_book_metadata(req: HttpRequest) -> Dict[str, Any]:
     logger.info("Processing book metadata")
@@ -162,8 +165,9 @@ def initiate_chunking(book_id: str) -> None:
     payload = {"book_id": book_id}
     response = requests.post(CHUNKING_URL, headers=headers, json=payload)
     
-    if response.status_code != 200:
+    # pdfchun queues the job and answers with 202 Accepted
+    if response.status_code not in (200, 202):
         logger.error(f"Error initiating chunking process. Status code: {response.status_code}, Response: {response.text}")
         raise ValueError(f"Error initiating chunking process: {response.text}")
     
-    logger.info("Chunking process initiated successfully")
\ No newline at end of file
+    logger.info(f"Chunking process initiated successfully. Job ID: {response.json().get('job_id')}")
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""Minimal in-memory stand-in for Azurite's blob endpoint.
+
+Implements just enough of the Blob REST API for the benchmarks (create
+container, put blob, get blob with ranges, get blob properties) and ignores
+authentication. Use real Azurite whenever it is available.
+
+Usage:
+    python benchmarks/azurite_standin.py [--port 10000]
+"""
+import argparse
+import hashlib
+import uuid
+from email.utils import formatdate
+
+from aiohttp import web
+
+ACCOUNT = "devstoreaccount1"
+# Well-known Azurite development key
+ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
+
+
+def connection_string(port):
+    return (
+        f"DefaultEndpointsProtocol=http;AccountName={ACCOUNT};AccountKey={ACCOUNT_KEY};"
+        f"BlobEndpoint=http://127.0.0.1:{port}/{ACCOUNT};"
+    )
+
+
+def _headers(request, **extra):
+    headers = {
+        "x-ms-request-id": str(uuid.uuid4()),
+        "x-ms-version": request.headers.get("x-ms-version", "2021-08-06"),
+        "Date": formatdate(usegmt=True),
+    }
+    headers.update(extra)
+    return headers
+
+
+def _blob_headers(request, blob):
+    return _headers(
+        request,
+        ETag=blob["etag"],
+        **{
+            "Last-Modified": blob["modified"],
+            "x-ms-blob-type": "BlockBlob",
+            "Content-Type": blob["content_type"],
+            "Accept-Ranges": "bytes",
+        }
+    )
+
+
+def create_app():
+    containers = {}
+
+    async def put(request):
+        container = request.match_info["container"]
+        if request.query.get("restype") == "container":
+            if container in containers:
+                return web.Response(status=409, headers=_headers(request, **{"x-ms-error-code": "ContainerAlreadyExists"}))
+            containers[container] = {}
+            return web.Response(status=201, headers=_headers(request, ETag='"0x1"', **{"Last-Modified": formatdate(usegmt=True)}))
+        if container not in containers:
+            return web.Response(status=404, headers=_headers(request, **{"x-ms-error-code": "ContainerNotFound"}))
+        data = await request.read()
+        blob = {
+            "data": data,
+            "etag": f'"0x{hashlib.md5(data).hexdigest()[:16].upper()}"',
+            "modified": formatdate(usegmt=True),
+            "content_type": request.headers.get("x-ms-blob-content-type", "application/octet-stream"),
+        }
+        containers[container][request.match_info["blob"]] = blob
+        return web.Response(status=201, headers=_headers(request, ETag=blob["etag"], **{
+            "Last-Modified": blob["modified"], "x-ms-request-server-encrypted": "true"
+        }))
+
+    def find(request):
+        return containers.get(request.match_info["container"], {}).get(request.match_info["blob"])
+
+    async def head(request):
+        blob = find(request)
+        if blob is None:
+            return web.Response(status=404, headers=_headers(request, **{"x-ms-error-code": "BlobNotFound"}))
+        headers = _blob_headers(request, blob)
+        headers["Content-Length"] = str(len(blob["data"]))
+        return web.Response(status=200, headers=headers)
+
+    async def get(request):
+        blob = find(request)
+        if blob is None:
+            return web.Response(status=404, headers=_headers(request, **{"x-ms-error-code": "BlobNotFound"}))
+        data = blob["data"]
+        headers = _blob_headers(request, blob)
+        requested = request.headers.get("x-ms-range") or request.headers.get("Range")
+        if requested and data:
+            start, _, end = requested.split("=", 1)[1].partition("-")
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            return web.Response(status=206, body=data[start:end + 1], headers=headers)
+        return web.Response(status=200, body=data, headers=headers)
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_route("PUT", f"/{ACCOUNT}/{{container}}", put)
+    app.router.add_route("PUT", f"/{ACCOUNT}/{{container}}/{{blob:.+}}", put)
+    app.router.add_route("HEAD", f"/{ACCOUNT}/{{container}}/{{blob:.+}}", head)
+    app.router.add_route("GET", f"/{ACCOUNT}/{{container}}/{{blob:.+}}", get)
+    return app
+
+
+def serve(port):
+    web.run_app(create_app(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=10000)
+    args = parser.parse_args()
+    print(f"Blob stand-in listening on http://127.0.0.1:{args.port}/{ACCOUNT}")
+    serve(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Requests per second for small-blob operations: per-request sync clients vs the shared aio client.
+
+Each operation reads the properties of a 4 KB blob and downloads it, as the
+upload check and chunking paths do. The "before" mode creates a sync
+``BlobServiceClient`` per operation, as the functions used to, and runs the
+operations on a thread pool. The "after" mode issues them concurrently
+through ``shared_code.blob_clients.get_blob_service_client``.
+
+By default it talks to Azurite (``UseDevelopmentStorage=true``); pass
+``--standin`` to start ``benchmarks/azurite_standin.py`` in a subprocess when
+no Azurite is running.
+
+Usage:
+    python benchmarks/blob_client_bench.py [--operations 2000] [--concurrency 16] [--standin]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobServiceClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+from azurite_standin import connection_string, serve
+from shared_code.blob_clients import close_blob_clients, get_blob_service_client
+
+CONTAINER = "benchmarks"
+BLOB_NAME = "small_blob.bin"
+AZURITE = "UseDevelopmentStorage=true"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Stand-in did not start on port {port}")
+
+
+def prepare(conn_str, size):
+    service = BlobServiceClient.from_connection_string(conn_str)
+    container = service.get_container_client(CONTAINER)
+    try:
+        container.create_container()
+    except ResourceExistsError:
+        pass
+    container.upload_blob(BLOB_NAME, os.urandom(size), overwrite=True)
+
+
+def sync_operation(conn_str):
+    service = BlobServiceClient.from_connection_string(conn_str)
+    blob = service.get_blob_client(CONTAINER, BLOB_NAME)
+    blob.get_blob_properties()
+    return len(blob.download_blob().readall())
+
+
+def run_before(conn_str, operations, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: sync_operation(conn_str), range(operations)))
+    return operations / (time.perf_counter() - started)
+
+
+async def run_after(conn_str, operations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def operation():
+        async with semaphore:
+            blob = get_blob_service_client(conn_str).get_blob_client(CONTAINER, BLOB_NAME)
+            await blob.get_blob_properties()
+            downloader = await blob.download_blob()
+            return len(await downloader.readall())
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(operation() for _ in range(operations)))
+        return operations / (time.perf_counter() - started)
+    finally:
+        await close_blob_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--connection-string", default=os.getenv("AZURE_STORAGE_CONNECTION_STRING", AZURITE))
+    parser.add_argument("--standin", action="store_true", help="start the in-memory stand-in instead of using Azurite")
+    args = parser.parse_args()
+
+    server = None
+    conn_str = args.connection_string
+    if args.standin:
+        port = free_port()
+        server = multiprocessing.get_context("spawn").Process(target=serve, args=(port,), daemon=True)
+        server.start()
+        wait_for_port(port)
+        conn_str = connection_string(port)
+
+    try:
+        prepare(conn_str, args.size)
+        before = run_before(conn_str, args.operations, args.concurrency)
+        after = asyncio.run(run_after(conn_str, args.operations, args.concurrency))
+        print(f"per-request sync client  {before:8.1f} ops/s")
+        print(f"shared aio client        {after:8.1f} ops/s   ({after / before:.2f}x)")
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Compare peak memory of the in-memory and the streamed blob download.
+
+Uploads a synthetic scanned-style PDF (one incompressible image per page) to
+a blob container and opens it once with the old
+``readall()`` + ``fitz.open(stream=...)`` path and once through
+``open_blob_pdf``. Each mode runs in a fresh process so peak RSS is measured
+in isolation.
+
+By default it talks to Azurite (``UseDevelopmentStorage=true``); pass
+``--connection-string`` for another account or ``--local`` to use the
+in-process stand-in below when no Azurite is running.
+
+Usage:
+    python benchmarks/blob_download_bench.py [--pages 300] [--image-kb 300] [--local]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "pdfchun"))
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+from blob_download import open_blob_pdf
+from page_store_bench import PARAGRAPH
+
+CONTAINER = "benchmarks"
+BLOB_NAME = "blob_download_bench.pdf"
+AZURITE = "UseDevelopmentStorage=true"
+RANGE_SIZE = 4 * 1024 * 1024
+
+
+class LocalDownloader:
+    """Mimics StorageStreamDownloader: serves the blob in ranged reads."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def readall(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def readinto(self, stream):
+        size = 0
+        with open(self.path, "rb") as f:
+            while chunk := f.read(RANGE_SIZE):
+                stream.write(chunk)
+                size += len(chunk)
+        return size
+
+
+class LocalBlobClient:
+    """Local blob stand-in backed by a file, for machines without Azurite."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def download_blob(self, max_concurrency=1):
+        return LocalDownloader(self.path)
+
+
+def build_scanned_pdf(num_pages, image_kb):
+    side = int((image_kb * 1024 / 3) ** 0.5)
+    document = fitz.open()
+    for page_num in range(num_pages):
+        page = document.new_page()
+        scan = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), False)
+        page.insert_image(fitz.Rect(50, 300, 550, 800), pixmap=scan)
+        page.insert_textbox(fitz.Rect(50, 50, 550, 290), f"Seite {page_num + 1}\n" + PARAGRAPH * 3, fontsize=9)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def get_blob_client(args):
+    if args.local:
+        return LocalBlobClient(args.local_path)
+    from azure.storage.blob import BlobServiceClient
+    service = BlobServiceClient.from_connection_string(args.connection_string)
+    return service.get_blob_client(container=CONTAINER, blob=BLOB_NAME)
+
+
+def upload(args, data):
+    if args.local:
+        with open(args.local_path, "wb") as f:
+            f.write(data)
+        return
+    from azure.storage.blob import BlobServiceClient
+    service = BlobServiceClient.from_connection_string(args.connection_string)
+    container = service.get_container_client(CONTAINER)
+    if not container.exists():
+        container.create_container()
+    container.upload_blob(BLOB_NAME, data, overwrite=True)
+
+
+def peak_rss_mb():
+    # VmHWM belongs to the process image, unlike ru_maxrss which survives fork and exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def read_all_pages(document):
+    for page in document:
+        page.get_text()
+
+
+def run_legacy(args, result):
+    started = time.perf_counter()
+    pdf_bytes = get_blob_client(args).download_blob().readall()
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as document:
+        read_all_pages(document)
+    result.put((time.perf_counter() - started, peak_rss_mb()))
+
+
+def run_streamed(args, result):
+    async def go():
+        async with open_blob_pdf(get_blob_client(args), max_concurrency=4) as (_, document):
+            read_all_pages(document)
+
+    started = time.perf_counter()
+    asyncio.run(go())
+    result.put((time.perf_counter() - started, peak_rss_mb()))
+
+
+def measure(target, args):
+    context = multiprocessing.get_context("spawn")
+    result = context.Queue()
+    process = context.Process(target=target, args=(args, result))
+    process.start()
+    elapsed, peak_mb = result.get()
+    process.join()
+    return elapsed, peak_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--image-kb", type=int, default=300)
+    parser.add_argument("--connection-string", default=os.getenv("AZURE_STORAGE_CONNECTION_STRING", AZURITE))
+    parser.add_argument("--local", action="store_true", help="use the in-process blob stand-in instead of Azurite")
+    parser.add_argument("--local-path", default=os.path.join(ROOT, "benchmarks", BLOB_NAME))
+    args = parser.parse_args()
+
+    data = build_scanned_pdf(args.pages, args.image_kb)
+    print(f"Uploading {len(data) / 1024 / 1024:.1f} MB PDF with {args.pages} pages ...")
+    upload(args, data)
+    del data
+
+    try:
+        for label, target in (("readall + stream", run_legacy), ("temp file", run_streamed)):
+            elapsed, peak_mb = measure(target, args)
+            print(f"{label:18} {elapsed:7.2f}s   peak RSS {peak_mb:8.1f} MB")
+    finally:
+        if args.local and os.path.exists(args.local_path):
+            os.remove(args.local_path)
+
+
+if __name__ == "__main__":
+    main()
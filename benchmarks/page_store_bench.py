@@ -0,0 +1,103 @@
+"""Compare page text extraction with and without the PageTextStore.
+
+Generates a synthetic PDF (1000 pages by default) and replays the page reads
+of intelligent_chunking: the TOC scan of the first 19 pages, the TOC text and
+either 25 chapters (TOC path) or 15 fixed chunks (fallback path).
+
+Usage:
+    python benchmarks/page_store_bench.py [--pages 1000] [--repeat 3]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "pdfchun"))
+from page_store import PageTextStore
+
+PARAGRAPH = (
+    "Die Thermodynamik beschäftigt sich mit der Umwandlung von Energie in ihre verschiedenen Formen. "
+    "Im Mittelpunkt stehen dabei die Begriffe Wärme, Arbeit und innere Energie.\n"
+)
+
+
+def build_pdf(num_pages):
+    document = fitz.open()
+    for page_num in range(num_pages):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), f"Seite {page_num + 1}\n" + PARAGRAPH * 12, fontsize=9)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def chapter_ranges(num_pages, count):
+    size = math.ceil(num_pages / count)
+    return [(start, min(start + size, num_pages)) for start in range(0, num_pages, size)]
+
+
+def legacy_path(document, fallback):
+    """Page reads as done before the PageTextStore, including repeated += concatenation."""
+    for page_num in range(min(19, len(document))):
+        document[page_num].get_text()
+
+    text = ""
+    for page_num in range(1, 3):
+        text += document[page_num].get_text() + "\n"
+
+    if fallback:
+        for start, end in chapter_ranges(len(document), 15):
+            content = ''
+            for page_num in range(start, end):
+                content += document[page_num].get_text() + "\n"
+                content = content.replace('\x00', '')
+                content = content.encode('utf-8', 'replace').decode('utf-8')
+    else:
+        for start, end in chapter_ranges(len(document), 25):
+            text = ""
+            for page_num in range(start, end):
+                text += document[page_num].get_text() + "\n"
+
+
+def store_path(document, fallback):
+    pages = PageTextStore(document)
+    for page_num in range(min(19, len(pages))):
+        pages.page(page_num)
+
+    pages.text(1, 3)
+
+    for start, end in chapter_ranges(len(pages), 15 if fallback else 25):
+        pages.text(start, end)
+
+
+def measure(func, data, fallback, repeat):
+    timings = []
+    for _ in range(repeat):
+        with fitz.open(stream=data, filetype="pdf") as document:
+            started = time.perf_counter()
+            func(document, fallback)
+            timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Generating {args.pages}-page PDF ...")
+    data = build_pdf(args.pages)
+
+    for label, fallback in (("TOC path", False), ("Fallback path", True)):
+        legacy = measure(legacy_path, data, fallback, args.repeat)
+        store = measure(store_path, data, fallback, args.repeat)
+        print(f"{label:14} legacy {legacy:7.3f}s   page store {store:7.3f}s   speedup {legacy / store:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Measure page extraction time for different numbers of worker processes.
+
+Usage:
+    python benchmarks/parallel_extract_bench.py [--pages 1200] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "pdfchun"))
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+from page_store_bench import build_pdf
+from parallel_extract import _extract_range, extract_pages_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=1200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    print(f"Generating {args.pages}-page PDF ...")
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(build_pdf(args.pages))
+        pdf_file.flush()
+
+        started = time.perf_counter()
+        _extract_range(pdf_file.name, 0, args.pages)
+        baseline = time.perf_counter() - started
+        print(f"in-process    {baseline:7.3f}s")
+
+        for workers in sorted(set(args.workers)):
+            started = time.perf_counter()
+            extract_pages_parallel(pdf_file.name, args.pages, workers)
+            elapsed = time.perf_counter() - started
+            print(f"{workers:2d} workers    {elapsed:7.3f}s   speedup {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Offline end-to-end benchmark of the chunking pipeline.
+
+Generates synthetic books with PyMuPDF (TOC pages, an embedded outline or
+neither), uploads them to a blob endpoint, queues them as chunking jobs and
+runs the real worker against a local Postgres. OpenAI is replaced by a fake
+structured-output backend with configurable latency. Reports pages/sec, LLM
+calls and DB round trips per book, peak RSS of the worker process and
+p50/p95 per stage (from the telemetry spans).
+
+The DSN should point to a scratch database. ``--create-schema`` creates the
+``book``, ``topic`` and ``chunk`` tables if they are missing and seeds topics
+into an empty ``topic`` table. The benchmark books use ids from 990000 upwards
+and are deleted afterwards.
+
+``--save`` writes the results as JSON; ``--baseline`` compares a run with such
+a file and exits with status 1 if a headline metric got worse by more than
+``--max-regression``.
+
+Usage:
+    python benchmarks/pipeline_bench.py --dsn postgresql://postgres@localhost:5432/bench --standin --create-schema
+        [--pages 100,400] [--layouts toc,outline,none] [--llm-latency-ms 40] [--save results.json] [--baseline results.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import statistics
+import sys
+import time
+import types
+from urllib.parse import urlparse
+
+import fitz
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobServiceClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+from azurite_standin import connection_string, serve
+from blob_client_bench import free_port, wait_for_port
+from shared_code.blob_clients import close_blob_clients
+import pdfchun as P
+from checkpoints import ensure_checkpoint_schema
+
+CONTAINER = "benchmarks"
+AZURITE = "UseDevelopmentStorage=true"
+FIRST_BOOK_ID = 990000
+TOPICS = ["Mechanik", "Thermodynamik", "Elektrodynamik", "Optik", "Quantenphysik", "Organische Chemie", "Anorganische Chemie", "Analysis"]
+SENTENCES = [
+    "Die Energie eines abgeschlossenen Systems bleibt erhalten.",
+    "Wärme fließt von selbst nur vom wärmeren zum kälteren Körper.",
+    "Das elektrische Feld einer Punktladung nimmt mit dem Quadrat des Abstands ab.",
+    "Licht wird an der Grenzfläche zweier Medien gebrochen.",
+    "Die Reaktionsgeschwindigkeit steigt mit der Temperatur.",
+    "Eine stetige Funktion auf einem kompakten Intervall nimmt ihr Maximum an.",
+    "Der Impuls ist das Produkt aus Masse und Geschwindigkeit.",
+    "Säuren geben in wässriger Lösung Protonen ab.",
+]
+HEADLINE = {
+    # Kennzahl: True, wenn ein größerer Wert besser ist
+    "pages_per_second": True,
+    "llm_calls_per_book": False,
+    "db_round_trips_per_book": False,
+    "peak_rss_mb": False,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS book (book_id SERIAL PRIMARY KEY, title TEXT, url TEXT);
+CREATE TABLE IF NOT EXISTS topic (topic_id SERIAL PRIMARY KEY, topic TEXT, description TEXT);
+CREATE TABLE IF NOT EXISTS chunk (
+    chunk_id SERIAL PRIMARY KEY,
+    book_id INTEGER,
+    startpage INTEGER,
+    endpage INTEGER,
+    is_relevant BOOLEAN,
+    chaptername TEXT,
+    content TEXT,
+    topic_id INTEGER,
+    relevance_percentage DOUBLE PRECISION,
+    usage_count INTEGER
+);
+"""
+
+
+def build_book(num_pages, layout, num_chapters=20, seed=0):
+    """Synthetic book with ``num_chapters`` chapters of equal length.
+
+    ``toc`` adds two table-of-contents pages in front, ``outline`` an embedded
+    outline, ``none`` neither (fixed-size fallback).
+    """
+    rng = random.Random(seed)
+    chapter_pages = max(1, num_pages // num_chapters)
+    chapters = [(f"Kapitel {index + 1}", start) for index, start in enumerate(range(0, num_pages, chapter_pages))]
+    document = fitz.open()
+    offset = 0
+    if layout == "toc":
+        offset = 2
+        half = (len(chapters) + 1) // 2
+        for entries in (chapters[:half], chapters[half:]):
+            lines = ["Inhaltsverzeichnis"] + [f"{title} {'.' * 20} {start + offset + 1}" for title, start in entries]
+            document.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), "\n".join(lines), fontsize=9)
+    for page_num in range(num_pages):
+        heading = next((title for title, start in chapters if start == page_num), "")
+        body = " ".join(rng.choice(SENTENCES) for _ in range(30))
+        document.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), f"{heading}\n{body}\n{page_num + 1}", fontsize=9)
+    if layout == "outline":
+        document.set_toc([[1, title, start + 1] for title, start in chapters])
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+class Completion:
+    def __init__(self, parsed, prompt_tokens, completion_tokens):
+        self.choices = [types.SimpleNamespace(message=types.SimpleNamespace(parsed=parsed))]
+        self.usage = types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+class FakeCompletions:
+    """Deterministic stand-in for ``client.beta.chat.completions`` with configurable latency."""
+
+    def __init__(self, latency, jitter):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(0)
+
+    async def parse(self, model, messages, response_format, **kwargs):
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        prompt = "\n".join(message["content"] for message in messages)
+        parsed = self.answer(response_format, messages[-1]["content"], prompt)
+        return Completion(parsed, len(prompt) // 4 + 1, len(parsed.model_dump_json()) // 4 + 1)
+
+    def answer(self, response_format, user, prompt):
+        topic_ids = [int(topic_id) for topic_id in re.findall(r"^(\d+)\. ", prompt, re.MULTILINE)] or [1]
+        topic_id = topic_ids[len(user) % len(topic_ids)]
+        if response_format is P.TOCAnalysis:
+            is_toc = "Inhaltsverzeichnis" in user
+            return P.TOCAnalysis(is_toc_page=is_toc, has_chapter_names_with_page_numbers=is_toc)
+        if response_format is P.TOCContents:
+            chapters = [P.ChapterInfo(chapter=title.strip(), start_page=int(page))
+                        for title, page in re.findall(r"^(.+?) \.{3,} (\d+)$", user, re.MULTILINE)]
+            return P.TOCContents(chapters=sorted(chapters, key=lambda chapter: chapter.start_page))
+        if response_format is P.ClassificationResult:
+            return P.ClassificationResult(topic_id=topic_id, confidence=0.85)
+        if response_format is P.TitleAndRelevanceResponse:
+            return P.TitleAndRelevanceResponse(generated_title=user.strip().split("\n")[0][:60], is_relevant=True)
+        if response_format is P.BatchAnalysisResponse:
+            return P.BatchAnalysisResponse(results=[
+                P.ChunkAnalysis(chunk_id=int(chunk_id), generated_title=f"Abschnitt {chunk_id}", is_relevant=True,
+                                topic_id=topic_id, confidence=0.85)
+                for chunk_id in re.findall(r"^### Chunk (\d+)$", user, re.MULTILINE)
+            ])
+        raise ValueError(f"No fake response for {response_format.__name__}")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def run_benchmark(args, books):
+    telemetry = P.telemetry
+    await P.init_db_pool()
+    pool = P.db_pool
+    if args.create_schema:
+        await pool.execute(SCHEMA)
+        if not await pool.fetchval("SELECT count(*) FROM topic"):
+            for topic in TOPICS:
+                await pool.execute("INSERT INTO topic (topic) VALUES ($1)", topic)
+    await P.ensure_job_schema(pool)
+    # cleanup löscht auch Checkpoints, die Tabelle muss also vorher existieren
+    await ensure_checkpoint_schema(pool)
+
+    book_ids = [book_id for book_id, _, _ in books]
+    for book_id, blob_name, _ in books:
+        await pool.execute(
+            "INSERT INTO book (book_id, title, url) VALUES ($1, $2, $3) ON CONFLICT (book_id) DO UPDATE SET url = EXCLUDED.url",
+            book_id, f"Benchmark {blob_name}", blob_name
+        )
+    await cleanup(pool, book_ids)
+    for book_id, _, _ in books:
+        await P.enqueue_job(pool, book_id)
+
+    telemetry.samples = {}
+    started = time.perf_counter()
+    try:
+        processed = await P.process_job_queue()
+        elapsed = time.perf_counter() - started
+        jobs = await pool.fetch("SELECT status, error FROM chunking_job WHERE book_id = ANY($1::int[])", book_ids)
+        chunks = await pool.fetchval("SELECT count(*) FROM chunk WHERE book_id = ANY($1::int[])", book_ids)
+    finally:
+        await cleanup(pool, book_ids)
+        await pool.execute("DELETE FROM book WHERE book_id = ANY($1::int[])", book_ids)
+        await pool.close()
+        await close_blob_clients()
+    failed = [job["error"] for job in jobs if job["status"] != "completed"]
+    return elapsed, processed, chunks, failed, telemetry.samples
+
+
+async def cleanup(pool, book_ids):
+    await pool.execute("DELETE FROM chunk WHERE book_id = ANY($1::int[])", book_ids)
+    await pool.execute("DELETE FROM chunking_job WHERE book_id = ANY($1::int[])", book_ids)
+    await pool.execute("DELETE FROM chunking_checkpoint WHERE book_id = ANY($1::int[])", book_ids)
+
+
+def configure(args, conn_str):
+    dsn = urlparse(args.dsn)
+    P.config.update(
+        db_user=dsn.username or "", db_password=dsn.password or "", db_host=dsn.hostname or "localhost",
+        db_port=str(dsn.port or 5432), db_name=dsn.path.lstrip("/"),
+        azure_storage_connection_string=conn_str, azure_container_name=CONTAINER,
+        llm_cache_enabled=False, llm_concurrency=args.llm_concurrency, llm_batch_mode=args.batch_mode,
+        job_worker_concurrency=args.worker_concurrency, job_worker_max_seconds=24 * 3600, telemetry_enabled=True,
+    )
+    P.telemetry.enabled = True
+    P.client = types.SimpleNamespace(beta=types.SimpleNamespace(chat=types.SimpleNamespace(
+        completions=FakeCompletions(args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000)
+    )))
+
+
+def summarize(args, books, elapsed, processed, chunks, samples):
+    total_pages = sum(pages for _, _, pages in books)
+    llm_calls = sum(len(values) for key, values in samples.items() if key.startswith("llm_call"))
+    # Nur der Worker-Prozess; Extraktions-Worker und Blob-Stand-in laufen in eigenen Prozessen
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "config": {
+            "pages": args.pages, "layouts": args.layouts, "books_per_case": args.books,
+            "llm_latency_ms": args.llm_latency_ms, "batch_mode": args.batch_mode,
+        },
+        "books": processed,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(total_pages / elapsed, 2),
+        "llm_calls_per_book": round(llm_calls / len(books), 2),
+        "db_round_trips_per_book": round(len(samples.get("db_query", [])) / len(books), 2),
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+        "stages": {
+            key: {
+                "count": len(values),
+                "p50_ms": round(1000 * statistics.median(values), 2),
+                "p95_ms": round(1000 * percentile(values, 0.95), 2),
+            }
+            for key, values in sorted(samples.items())
+        },
+    }
+
+
+def report(results, baseline, max_regression):
+    print(f"{results['books']} books, {results['chunks']} chunks in {results['seconds']:.2f} s")
+    regressions = []
+    for metric, higher_is_better in HEADLINE.items():
+        value = results[metric]
+        line = f"  {metric:26} {value:10.2f}"
+        if baseline is not None and baseline.get(metric):
+            change = (value - baseline[metric]) / baseline[metric]
+            worse = -change if higher_is_better else change
+            line += f"   baseline {baseline[metric]:10.2f}  {100 * change:+6.1f}%"
+            if worse > max_regression:
+                line += "  REGRESSION"
+                regressions.append(metric)
+        print(line)
+
+    print(f"\n  {'stage':36} {'count':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for key, stage in results["stages"].items():
+        line = f"  {key:36} {stage['count']:7} {stage['p50_ms']:9.2f} {stage['p95_ms']:9.2f}"
+        before = (baseline or {}).get("stages", {}).get(key)
+        if before and before["p95_ms"]:
+            line += f"   p95 {100 * (stage['p95_ms'] - before['p95_ms']) / before['p95_ms']:+6.1f}%"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", "postgresql://postgres@localhost:5432/postgres"))
+    parser.add_argument("--pages", default="100,400", help="comma-separated book sizes")
+    parser.add_argument("--layouts", default="toc,outline,none", help="comma-separated: toc, outline, none")
+    parser.add_argument("--books", type=int, default=1, help="books per size and layout")
+    parser.add_argument("--llm-latency-ms", type=float, default=40.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--llm-concurrency", type=int, default=5)
+    parser.add_argument("--worker-concurrency", type=int, default=2)
+    parser.add_argument("--batch-mode", action="store_true", help="enable LLM_BATCH_MODE")
+    parser.add_argument("--connection-string", default=os.getenv("AZURE_STORAGE_CONNECTION_STRING", AZURITE))
+    parser.add_argument("--standin", action="store_true", help="start the in-memory blob stand-in instead of using Azurite")
+    parser.add_argument("--create-schema", action="store_true", help="create missing book/topic/chunk tables")
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with results saved by an earlier run")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="tolerated relative regression of headline metrics")
+    args = parser.parse_args()
+
+    server = None
+    conn_str = args.connection_string
+    if args.standin:
+        port = free_port()
+        server = multiprocessing.get_context("spawn").Process(target=serve, args=(port,), daemon=True)
+        server.start()
+        wait_for_port(port)
+        conn_str = connection_string(port)
+
+    try:
+        container = BlobServiceClient.from_connection_string(conn_str).get_container_client(CONTAINER)
+        try:
+            container.create_container()
+        except ResourceExistsError:
+            pass
+        books = []
+        for num_pages in (int(value) for value in args.pages.split(",")):
+            for layout in args.layouts.split(","):
+                data = build_book(num_pages, layout)
+                blob_name = f"pipeline_bench_{layout}_{num_pages}.pdf"
+                container.upload_blob(blob_name, data, overwrite=True)
+                for _ in range(args.books):
+                    books.append((FIRST_BOOK_ID + len(books), blob_name, len(fitz.open(stream=data, filetype="pdf"))))
+
+        configure(args, conn_str)
+        elapsed, processed, chunks, failed, samples = asyncio.run(run_benchmark(args, books))
+    finally:
+        if server is not None:
+            server.terminate()
+
+    results = summarize(args, books, elapsed, processed, chunks, samples)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.max_regression)
+    if failed:
+        print(f"\n{len(failed)} jobs did not complete: {failed}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if regressions or failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
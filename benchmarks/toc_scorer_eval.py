@@ -0,0 +1,40 @@
+"""Evaluate the local TOC page scorer against the labelled fixture pages.
+
+Usage:
+    python benchmarks/toc_scorer_eval.py [--reject 0.25] [--accept 0.7]
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "pdfchun"))
+from toc_heuristics import evaluate_toc_scorer, score_toc_page
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures", "toc_pages.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reject", type=float, default=float(os.getenv("TOC_SCORE_REJECT", "0.25")))
+    parser.add_argument("--accept", type=float, default=float(os.getenv("TOC_SCORE_ACCEPT", "0.7")))
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        samples = json.load(f)
+
+    for sample in samples:
+        print(f"{score_toc_page(sample['text']):5.2f}  {'TOC' if sample['is_toc'] else '   '}  {sample['name']}")
+
+    report = evaluate_toc_scorer(samples, args.reject, args.accept)
+    print()
+    print(f"Pages:           {report['pages']}")
+    print(f"Precision:       {report['precision']:.2f}")
+    print(f"Recall:          {report['recall']:.2f}")
+    print(f"LLM calls:       {report['llm_calls']}")
+    print(f"LLM calls saved: {report['llm_calls_saved']} ({report['llm_calls_saved'] / report['pages']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
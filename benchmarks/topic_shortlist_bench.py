@@ -0,0 +1,91 @@
+"""Prompt size, recall@k and lookup time of the topic shortlist for growing topic tables.
+
+Builds synthetic topic tables of the given sizes. Every topic has a two-word
+name and a few characteristic terms, and every labelled text mixes terms of
+its topic with general vocabulary. For each size it reports the estimated
+category-list tokens of a classification prompt with all topics and with
+the shortlist, the recall@k of the shortlist (k-fold over the labelled
+texts, as ``action=evaluate_classifier`` does on stored chunks) and the time
+per shortlist lookup.
+
+Usage:
+    python benchmarks/topic_shortlist_bench.py [--topics 100,1000,5000] [--k 50]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "pdfchun"))
+from topic_catalog import TopicSnapshot
+from topic_classifier import TopicClassifier, evaluate_topic_classifier
+
+LETTERS = "abcdefghiklmnoprstuwäöü"
+
+
+def word(rng):
+    return "".join(rng.choice(LETTERS) for _ in range(rng.randint(5, 10)))
+
+
+def build(num_topics, texts_per_topic, rng):
+    rows = []
+    terms = {}
+    for topic_id in range(1, num_topics + 1):
+        rows.append((topic_id, f"{word(rng).capitalize()} {word(rng)}"))
+        terms[topic_id] = [word(rng) for _ in range(8)]
+    general = [word(rng) for _ in range(500)]
+
+    labelled = []
+    for topic_id, name in rows:
+        for _ in range(texts_per_topic):
+            # Wenige eigene Begriffe, oft Begriffe eines anderen Themas, nicht immer der Name
+            words = rng.sample(terms[topic_id], 3) + rng.choices(general, k=60)
+            words += rng.sample(terms[rng.randint(1, num_topics)], 2)
+            if rng.random() < 0.5:
+                words += name.lower().split()
+            rng.shuffle(words)
+            labelled.append((" ".join(words), topic_id))
+    rng.shuffle(labelled)
+    return TopicSnapshot(rows), labelled
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", default="100,1000,5000", help="comma-separated topic table sizes")
+    parser.add_argument("--k", type=int, default=50, help="shortlist size (TOPIC_SHORTLIST_K)")
+    parser.add_argument("--texts-per-topic", type=int, default=3)
+    parser.add_argument("--max-texts", type=int, default=2000, help="labelled texts used, like LOCAL_CLASSIFIER_MAX_CHUNKS")
+    args = parser.parse_args()
+
+    print(f"{'topics':>7} {'all tokens':>11} {'shortlist':>10} {'recall@5':>9} {'recall@k':>9} {'lookup ms':>10} {'train s':>8}")
+    for num_topics in (int(value) for value in args.topics.split(",")):
+        rng = random.Random(num_topics)
+        topics, labelled = build(num_topics, args.texts_per_topic, rng)
+        labelled = labelled[:args.max_texts]
+
+        started = time.perf_counter()
+        classifier = TopicClassifier(topics, labelled[len(labelled) // 2:])
+        train_seconds = time.perf_counter() - started
+
+        queries = [text for text, _ in labelled[:200]]
+        started = time.perf_counter()
+        shortlists = [classifier.shortlist(text, args.k) for text in queries]
+        lookup_ms = (time.perf_counter() - started) / len(queries) * 1000
+        shortlist_tokens = sum(estimate_tokens(topics.categories_for(ids)) for ids in shortlists) / len(shortlists)
+
+        report = evaluate_topic_classifier(topics, labelled, thresholds=(), ks=(5, args.k))
+        print(
+            f"{num_topics:>7} {estimate_tokens(topics.categories):>11} {shortlist_tokens:>10.0f} "
+            f"{report['recall_at_k']['5']:>9.3f} {report['recall_at_k'][str(args.k)]:>9.3f} "
+            f"{lookup_ms:>10.2f} {train_seconds:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
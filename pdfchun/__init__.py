@@ -1,27 +1,28 @@
 import logging
 import os
+import atexit
 import sys
 import time
 import uuid
 import gc
-import io
 import json
+import hashlib
+import tracemalloc
 import asyncpg
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
-from azure.functions import HttpRequest, HttpResponse
+from azure.functions import HttpRequest, HttpResponse, TimerRequest
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
-from openai import OpenAI
+from openai import AsyncOpenAI
 import re
 import fitz  # Replace pdfplumber with fitz
 import math
 import asyncio
-from functools import wraps
+from functools import partial, wraps
+from collections import Counter
 import psutil
 import random 
 from pydantic import BaseModel
-from typing import List, Tuple
 
 import logging
 
@@ -30,15 +31,40 @@ logger = logging.getLogger(__name__)
 
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from shared_code.blob_clients import get_blob_service_client
 from config import get_config
 from logger_config import setup_logger
+from toc_heuristics import classify_toc_page, score_toc_page
+from llm_cache import LLMCache
+from llm_scheduler import LLMScheduler, CircuitBreaker, CircuitOpenError, PRIORITY_BULK, PRIORITY_HIGH
+from page_store import MUPDF_LOCK, PageTextStore
+from chunk_planner import plan_pieces
+from parallel_extract import extract_pages_parallel
+from blob_download import open_blob_pdf
+from topic_classifier import TopicClassifier, evaluate_topic_classifier
+from relevance import detect_relevance
+from checkpoints import CheckpointStore, file_fingerprint
+from db_pool import DatabasePool
+from topic_catalog import TopicCatalog, TopicSnapshot
+from telemetry import telemetry
+from time_budget import budget_allows, current_budget, time_budget
+from job_queue import ensure_job_schema, enqueue_job, claim_job, heartbeat, complete_job, fail_job, get_job
 
 # Initialization
 load_dotenv()
 config = get_config()
 logger = setup_logger('PDFLogger')
+telemetry.enabled = config["telemetry_enabled"]
 client = None
 db_pool = None
+llm_cache = None
+llm_scheduler = None
+topic_classifier = None
+topic_classifier_key = None
+topic_classifier_lock = asyncio.Lock()
+chunk_columns_ready = False
+chunk_staging_ready = False
+topic_catalog = None
 
 def setup_openai_client():
     logger.info("Setting up OpenAI client.")
@@ -47,12 +73,92 @@ def setup_openai_client():
         if not openai_api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
         
-        return OpenAI(api_key=openai_api_key)
+        # 429 und Verbindungsfehler wiederholt der LLMScheduler, nicht das SDK
+        return AsyncOpenAI(api_key=openai_api_key, max_retries=0)
     except Exception as e:
         logger.error(f"Error setting up OpenAI client: {str(e)}", exc_info=True)
         raise
 
 
+def get_llm_cache():
+    global llm_cache
+    if llm_cache is None and config["llm_cache_enabled"]:
+        try:
+            llm_cache = LLMCache(
+                config["llm_cache_path"],
+                max_bytes=config["llm_cache_max_mb"] * 1024 * 1024,
+                ttl_seconds=config["llm_cache_ttl_seconds"]
+            )
+        except Exception as e:
+            logger.error(f"Error opening LLM response cache, continuing without it: {str(e)}", exc_info=True)
+            config["llm_cache_enabled"] = False
+    return llm_cache
+
+def get_llm_scheduler():
+    global llm_scheduler
+    if llm_scheduler is None:
+        llm_scheduler = LLMScheduler(
+            config["llm_rpm_limit"],
+            config["llm_tpm_limit"],
+            config["llm_max_concurrency"],
+            max_retries=config["llm_max_retries"],
+            timeout=config["llm_timeout_seconds"],
+            deadline=config["llm_deadline_seconds"],
+            hedging=config["llm_hedging"],
+            breaker=CircuitBreaker(config["llm_breaker_failures"], config["llm_breaker_reset_seconds"])
+        )
+    return llm_scheduler
+
+async def parse_structured(messages, response_format, model="gpt-4o-2024-08-06", priority=PRIORITY_BULK, output_tokens=200, hedge=True):
+    """Run a structured-output completion and return the parsed model.
+
+    Responses are served from the LLM response cache when the same model,
+    messages and response schema were seen before. Other requests go through
+    the LLM scheduler with ``priority`` and a cost of the estimated prompt
+    tokens plus ``output_tokens``; with ``hedge`` a straggling request is
+    duplicated. Within a job, no request outlives the job's time budget.
+    Raises CircuitOpenError while OpenAI is degraded.
+    """
+    cache = get_llm_cache()
+    key = LLMCache.make_key(model, messages, response_format) if cache else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            telemetry.count("llm_cache_hits")
+            return response_format.model_validate_json(cached)
+
+    tokens = sum(estimate_tokens(message["content"]) + 4 for message in messages) + output_tokens
+
+    async def request():
+        with telemetry.span("llm_call", schema=response_format.__name__):
+            return await client.beta.chat.completions.parse(
+                model=model,
+                messages=messages,
+                response_format=response_format,
+            )
+
+    kind = response_format.__name__ if hedge else None
+    timeout = deadline = None
+    budget_capped = False
+    budget = current_budget()
+    if budget is not None:
+        deadline = budget.remaining()
+        if deadline <= 0:
+            raise asyncio.TimeoutError("The job's time budget is spent")
+        timeout = min(config["llm_timeout_seconds"], deadline)
+        budget_capped = deadline < config["llm_timeout_seconds"]
+    completion = await get_llm_scheduler().call(request, tokens, priority, kind=kind, timeout=timeout,
+                                                deadline=deadline, budget_capped=budget_capped)
+    if completion.usage is not None:
+        telemetry.count("llm_tokens", completion.usage.prompt_tokens, kind="prompt")
+        telemetry.count("llm_tokens", completion.usage.completion_tokens, kind="completion")
+    result = completion.choices[0].message.parsed
+
+    if key and result is not None:
+        cache.put(key, result.model_dump_json())
+    return result
+
+
 def get_db_connection_string(config):
     return f"postgresql://{config['db_user']}:{config['db_password']}@{config['db_host']}:{config['db_port']}/{config['db_name']}"
 
@@ -68,56 +174,214 @@ async def fetch_data_by_id_as_json(table_name, id_column="book_id", id_value=2):
         logger.error(f"Error fetching data: {str(e)}", exc_info=True)
         return None
 
-def chunk_pdf(blob_client, n_chunks=18):
-    logger.info(f"Starting PDF chunking process. Target chunks: {n_chunks}")
-    try:
-        blob_data = blob_client.download_blob()
-        buffer = io.BytesIO()
-        blob_data.readinto(buffer)
-        buffer.seek(0)
-        
-        with fitz.open(stream=buffer, filetype="pdf") as pdf:
-            num_pages = len(pdf)
-            chunk_size = math.ceil(num_pages / n_chunks)
-            logger.info(f"PDF has {num_pages} pages. Chunk size: {chunk_size}")
-            for start in range(0, num_pages, chunk_size):
-                end = min(start + chunk_size, num_pages)
-                content = ''
-                for page_num in range(start, end):
-                    page = pdf[page_num]
-                    content += page.get_text() + "\n"
-                yield {'start_page': start + 1, 'end_page': end, 'content': content.strip()}
-
-        logger.info("PDF chunking completed successfully.")
-    except Exception as e:
-        logger.error(f"Error chunking PDF: {str(e)}", exc_info=True)
-        yield None
-
 async def fetch_topics():
-    logger.info("Fetching topic IDs from the database")
+    """Return the topics as a TopicSnapshot from the process-wide catalog.
+
+    The database is only queried when the catalog's TTL expired or the topic
+    table changed.
+    """
+    global topic_catalog
+    if topic_catalog is None:
+        topic_catalog = TopicCatalog(
+            get_db_connection_string(config),
+            config["topic_catalog_ttl_seconds"],
+            listen=config["topic_catalog_listen"]
+        )
     try:
-        query = "SELECT topic_id,topic FROM topic"
-        topic_ids = await execute_with_retry(query, fetch_type='all')
-        print("***********************************")
-        print([row for row in topic_ids])
-        return [row for row in topic_ids]
+        return await topic_catalog.get(db_pool)
     except Exception as e:
         logger.error(f"Error fetching topic IDs: {str(e)}", exc_info=True)
-        return []
+        return TopicSnapshot([])
+
+def terminate_topic_catalog():
+    if topic_catalog:
+        topic_catalog.terminate()
 
+atexit.register(terminate_topic_catalog)
 
-async def insert_chunk(book_id, start_page, end_page, is_relevant, chapter_name, content, topic_id, relevance_percentage, usage_count):
-    insert_query = """
-        INSERT INTO chunk (book_id, startpage, endpage, is_relevant, chaptername, content, topic_id, relevance_percentage, usage_count)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+
+CHUNK_COLUMNS = [
+    'book_id', 'startpage', 'endpage', 'is_relevant', 'chaptername',
+    'content', 'topic_id', 'relevance_percentage', 'usage_count', 'content_fingerprint', 'parent_chapter',
+    'classification_source'
+]
+# Spalten, die erst bei Bedarf zu chunk hinzugefügt werden
+ADDED_CHUNK_COLUMNS = ('content_fingerprint', 'parent_chapter', 'classification_source')
+# Quellen von Klassifikationen, die vom LLM stammen und als Trainingsdaten taugen
+LLM_SOURCES = ['llm', 'llm_batch']
+
+def chunk_fingerprint(plan_name, content):
+    """Fingerprint of a planned chunk: its plan name and the text of its pages.
+
+    Page numbers are left out, so pages inserted before a chapter do not
+    invalidate it. Must match the SQL expression in fetch_chunk_fingerprints.
     """
-    try:
-        
-        await execute_with_retry(insert_query, book_id, start_page, end_page, is_relevant, chapter_name, content, topic_id, relevance_percentage, usage_count)
-        logger.info(f"Chunk inserted: {chapter_name} (Pages {start_page} to {end_page}, Topic ID: {topic_id})")
-    except Exception as e:
-        logger.error(f"Error inserting chunk: {str(e)}", exc_info=True)
-        raise
+    return hashlib.sha256(f"{plan_name}\x1f{content}".encode("utf-8")).hexdigest()
+
+async def ensure_chunk_columns():
+    """Add the ``ADDED_CHUNK_COLUMNS`` to ``chunk`` if they are missing."""
+    global chunk_columns_ready
+    if chunk_columns_ready:
+        return
+    # ALTER TABLE sperrt die Tabelle, daher nur wenn eine Spalte wirklich fehlt
+    rows = await execute_with_retry(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'chunk' AND column_name = ANY($1::text[])",
+        list(ADDED_CHUNK_COLUMNS),
+        fetch_type='all'
+    )
+    existing = {row[0] for row in rows}
+    for column in ADDED_CHUNK_COLUMNS:
+        if column in existing:
+            continue
+        await execute_with_retry(f"ALTER TABLE chunk ADD COLUMN IF NOT EXISTS {column} TEXT")
+        if column == 'content_fingerprint':
+            await execute_with_retry("CREATE INDEX IF NOT EXISTS idx_chunk_book_fingerprint ON chunk (book_id, content_fingerprint)")
+        logger.info(f"Added {column} column to the chunk table.")
+    chunk_columns_ready = True
+
+async def fetch_chunk_fingerprints(book_id):
+    """Return the fingerprints that occur exactly once among the stored chunks of ``book_id``.
+
+    Chunks stored before fingerprints existed are backfilled from their chapter
+    name and content first.
+    """
+    await ensure_chunk_columns()
+    await execute_with_retry(
+        """
+        UPDATE chunk
+        SET content_fingerprint = encode(sha256(convert_to(coalesce(chaptername, '') || chr(31) || content, 'UTF8')), 'hex')
+        WHERE book_id = $1 AND content_fingerprint IS NULL
+        """,
+        book_id
+    )
+    rows = await execute_with_retry("SELECT content_fingerprint FROM chunk WHERE book_id = $1", book_id, fetch_type='all')
+    counts = Counter(row[0] for row in rows)
+    return {fingerprint for fingerprint, count in counts.items() if count == 1}
+
+async def ensure_chunk_staging_table():
+    global chunk_staging_ready
+    if chunk_staging_ready:
+        return
+    # Gleiche Spalten und Typen wie chunk, ohne Constraints; UNLOGGED, da nur Zwischenablage
+    await execute_with_retry(
+        f"CREATE UNLOGGED TABLE IF NOT EXISTS chunk_staging AS SELECT {', '.join(CHUNK_COLUMNS)} FROM chunk WITH NO DATA"
+    )
+    # Staging-Tabellen älterer Versionen fehlen die später hinzugefügten Spalten
+    await execute_with_retry(
+        "ALTER TABLE chunk_staging ADD COLUMN IF NOT EXISTS parent_chapter TEXT, ADD COLUMN IF NOT EXISTS classification_source TEXT"
+    )
+    await execute_with_retry("CREATE INDEX IF NOT EXISTS idx_chunk_staging_book ON chunk_staging (book_id)")
+    chunk_staging_ready = True
+
+def reusable_chunks(fingerprints, stored):
+    """Indices of planned chunks whose fingerprint is stored and unique on both sides."""
+    counts = Counter(fingerprints)
+    return {
+        index for index, fingerprint in enumerate(fingerprints)
+        if fingerprint is not None and counts[fingerprint] == 1 and fingerprint in stored
+    }
+
+def reusable_chapters(pieces_by_chapter, stored):
+    """Chapters all of whose planned pieces are reusable.
+
+    ``pieces_by_chapter`` maps chapter index to ``(fingerprint, start_page,
+    end_page)`` per piece.
+    """
+    planned = [(index, fingerprint) for index, pieces in pieces_by_chapter.items() for fingerprint, _, _ in pieces]
+    reusable = reusable_chunks([fingerprint for _, fingerprint in planned], stored)
+    changed = {index for position, (index, _) in enumerate(planned) if position not in reusable}
+    return set(pieces_by_chapter) - changed
+
+class ChunkWriter:
+    """Buffers the chunks of one book and writes them in a single transaction.
+
+    With ``replace_existing`` the book's old chunks are deleted in the same
+    transaction, so an overwrite either fully succeeds or leaves the previous
+    chunks untouched. Chunks marked with ``keep`` survive the overwrite with
+    their classification and usage count; only their pages are updated.
+
+    With ``staged`` buffered chunks can be moved to ``chunk_staging`` early
+    with ``spill``, so streaming mode does not hold every chunk's text until
+    the end; ``flush`` then copies them into ``chunk`` in its transaction.
+    """
+
+    def __init__(self, book_id, replace_existing=False, staged=False):
+        self.book_id = book_id
+        self.replace_existing = replace_existing
+        self.staged = staged
+        self.records = []
+        self.kept = []
+        self.staged_count = 0
+        self.failed = 0
+
+    @property
+    def pending(self):
+        return len(self.records) + self.staged_count
+
+    async def reset_staging(self):
+        """Remove rows a previous, failed attempt left in ``chunk_staging``."""
+        await ensure_chunk_staging_table()
+        await execute_with_retry("DELETE FROM chunk_staging WHERE book_id = $1", self.book_id)
+
+    async def spill(self):
+        if not self.staged or not self.records:
+            return
+        async with db_pool.acquire() as conn:
+            with telemetry.span("chunk_staging"):
+                await conn.copy_records_to_table('chunk_staging', records=self.records, columns=CHUNK_COLUMNS)
+        self.staged_count += len(self.records)
+        self.records = []
+
+    def add(self, start_page, end_page, is_relevant, chapter_name, content, topic_id, relevance_percentage, usage_count, content_fingerprint=None,
+            parent_chapter=None, classification_source=None):
+        self.records.append((self.book_id, start_page, end_page, is_relevant, chapter_name, content, topic_id, relevance_percentage, usage_count,
+                             content_fingerprint, parent_chapter, classification_source))
+
+    def keep(self, content_fingerprint, start_page, end_page):
+        self.kept.append((self.book_id, content_fingerprint, start_page, end_page))
+
+    async def flush(self, max_retries=3, retry_delay=1):
+        await self.spill()
+        for attempt in range(max_retries):
+            try:
+                async with db_pool.acquire() as conn:
+                    with telemetry.stage("chunk_write"):
+                        async with conn.transaction():
+                            if self.replace_existing:
+                                deleted = await conn.execute(
+                                    "DELETE FROM chunk WHERE book_id = $1 AND (content_fingerprint IS NULL OR NOT content_fingerprint = ANY($2::text[]))",
+                                    self.book_id, [fingerprint for _, fingerprint, _, _ in self.kept]
+                                ) if self.kept else await conn.execute("DELETE FROM chunk WHERE book_id = $1", self.book_id)
+                                logger.info(f"Deleted existing chunks for book_id {self.book_id}: {deleted}")
+                            if self.kept:
+                                await conn.executemany(
+                                    "UPDATE chunk SET startpage = $3, endpage = $4 WHERE book_id = $1 AND content_fingerprint = $2",
+                                    self.kept
+                                )
+                            if self.records:
+                                await conn.copy_records_to_table('chunk', records=self.records, columns=CHUNK_COLUMNS)
+                            if self.staged_count:
+                                columns = ', '.join(CHUNK_COLUMNS)
+                                await conn.execute(
+                                    f"INSERT INTO chunk ({columns}) SELECT {columns} FROM chunk_staging WHERE book_id = $1 ORDER BY startpage, endpage",
+                                    self.book_id
+                                )
+                                await conn.execute("DELETE FROM chunk_staging WHERE book_id = $1", self.book_id)
+                break
+            except asyncpg.exceptions.TooManyConnectionsError:
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
+            except Exception as e:
+                logger.error(f"Error writing {self.pending} chunks for book_id {self.book_id}: {str(e)}", exc_info=True)
+                raise
+
+        count = self.pending
+        logger.info(f"Stored {count} chunks and kept {len(self.kept)} for book_id {self.book_id} in a single transaction.")
+        self.records = []
+        self.kept = []
+        self.staged_count = 0
+        return count
 
 def preprocess_text(text, max_length=700):
     logger.debug(f"Preprocessing text. Initial length: {len(text)}")
@@ -166,22 +430,15 @@ class TitleAndRelevanceResponse(BaseModel):
 async def generate_title_and_check_relevance(original_text):
     try:
         # Kombinierter Prompt für die Titelgenerierung und Relevanzprüfung
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
+        result = await parse_structured(
             messages=[
                 {"role": "system", "content": "Generate a title for the following  in the same language as the text and check if the text is relevant. The title should be short and concise (maximum 5 words). Relevant text means it does not contain a glossary, table of contents, or any other irrelevant content. Respond with the generated title and 'True' for relevant or 'False' for not relevant"},
                 {"role": "user", "content": f"Textabschnitt:\n{original_text}..."}
             ],
             response_format=TitleAndRelevanceResponse,
+            output_tokens=30,
         )
 
-        # Ausgabe des API-Antworttextes
-        print(f"Raw API response for content snippet:")
-        print(completion.choices[0].message)
-
-        # Extrahieren des Ergebnisses
-        result = completion.choices[0].message.parsed
-
         print(f"Generated title: {result.generated_title}")
         print(f"Relevance: {result.is_relevant}")
 
@@ -191,14 +448,38 @@ async def generate_title_and_check_relevance(original_text):
             "is_relevant": result.is_relevant
         }
 
+    except (CircuitOpenError, asyncio.TimeoutError) as e:
+        # OpenAI ist gestört: Überschrift als Titel statt eines fehlgeschlagenen Chunks
+        logger.warning(f"Title generation unavailable, using the first heading: {str(e) or type(e).__name__}")
+        telemetry.count("llm_fallbacks", kind="title")
+        return dict(HEADING_TITLE)
     except Exception as e:
         print(f"Error processing text: {e}")
         return None
     
 
-async def relevanz_check(chunk):
-    # relevanz check logic
-    return True
+def relevanz_check(page_texts):
+    """Detect index, glossary, bibliography, TOC and front matter chunks locally.
+
+    Returns ``{"is_relevant", "kind", "irrelevant_ratio"}``; irrelevant chunks
+    skip title generation and classification.
+    """
+    return detect_relevance(page_texts, config["relevance_irrelevant_ratio"])
+
+def first_heading(text, max_length=80):
+    """Return the first non-empty line of ``text`` as a fallback title."""
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            return line[:max_length]
+    return None
+
+SKIPPED_CLASSIFICATION = {"topic_id": None, "confidence": 0.0, "source": "skipped"}
+# Ein leerer Titel wird beim Speichern durch die erste Überschrift des Chunks ersetzt
+HEADING_TITLE = {"generated_title": "", "is_relevant": True}
+
+class IncompleteChunkingError(Exception):
+    """Some chunks failed; the completed ones are checkpointed for the next attempt."""
 
 async def check_if_chunks_exist(book_id):
     logger.info(f"Checking if chunks exist for book_id {book_id}.")
@@ -214,102 +495,78 @@ async def check_if_chunks_exist(book_id):
         logger.error(f"Error checking chunk existence for book_id {book_id}: {str(e)}", exc_info=True)
         return False
 
-async def delete_existing_chunks(book_id):
-    logger.info(f"Deleting existing chunks for book_id {book_id}")
-    try:
-        result = await execute_with_retry("DELETE FROM chunk WHERE book_id = $1", book_id)
-        logger.info(f"Deleted {result} existing chunks for book_id {book_id}.")
-    except Exception as e:
-        logger.error(f"Error deleting chunks for book_id {book_id}: {str(e)}", exc_info=True)
-
-async def process_and_store_chunks(blob_client, book_id):
-    logger.info(f"Starting process_and_store_chunks for book_id: {book_id}")
-    steps = []
-    try:
-        steps.append("Initiating chunk processing.")
-        chunk_count = 0
-        relevant_chunk_count = 0
-        
-        # Fetch topic IDs at the beginning of the process
-        topic_id = 1
-        if not topic_id:
-            logger.warning("No topic IDs found. Chunks will be inserted without topic assignment.")
-        
-        for chunk in chunk_pdf(blob_client):
-            if chunk is None:
-                continue
-            content = chunk['content']
-            start_page = chunk['start_page']
-            end_page = chunk['end_page']
-            
-            result = await generate_title_and_check_relevance(content)
-            chapter_name = result["generated_title"]
-            is_relevant = result["is_relevant"]
-            # Pass topic_ids to insert_chunk
-            await insert_chunk(book_id, start_page, end_page, is_relevant, chapter_name, content, topic_id)
-            
-            if is_relevant:
-                relevant_chunk_count += 1
-            
-            chunk_count += 1
-            if chunk_count % 10 == 0:
-                steps.append(f"Processed {chunk_count} chunks. {relevant_chunk_count} relevant chunks identified.")
-
-        logger.info(f"Successfully processed and stored {chunk_count} chunks. {relevant_chunk_count} chunks marked as relevant.")
-        steps.append(f"Completed: {chunk_count} chunks processed and stored. {relevant_chunk_count} chunks marked as relevant.")
-    except Exception as e:
-        logger.error(f"Failed to process and store chunks: {str(e)}", exc_info=True)
-        steps.append(f"Error: {str(e)}")
-    finally:
-        gc.collect()
-    return steps
-
-
 async def init_db_pool():
+    """Set up the process-wide pool; connections are opened on first use."""
     global db_pool
     if db_pool is None:
-        conn_string = get_db_connection_string(config)
-        db_pool = await asyncpg.create_pool(
-            conn_string,
-            min_size=1,
-            max_size=20,  # Adjust based on your needs and database limits
-            timeout=500.0
+        db_pool = DatabasePool(
+            get_db_connection_string(config),
+            min_size=config["db_pool_min_size"],
+            max_size=config["db_pool_max_size"],
+            connect_timeout=500.0,
+            statement_cache_size=config["db_statement_cache_size"],
+            max_inactive_connection_lifetime=config["db_max_inactive_connection_lifetime"],
+            health_check_seconds=config["db_health_check_seconds"]
         )
-    logger.info("Database connection pool initialized.")
+        logger.info("Database connection pool initialized.")
 
-async def close_db_pool():
-    global db_pool
+def terminate_db_pool():
+    """Drop the pool's connections at interpreter exit, the only shutdown of the process-wide pool.
+
+    The Functions host offers no async shutdown hook, and closing the pool
+    after an invocation would make the next one reconnect. Scripts that own
+    their event loop close ``db_pool`` themselves before the loop ends.
+    """
     if db_pool:
-        await db_pool.close()
-        db_pool = None
-    logger.info("Database connection pool closed.")
+        db_pool.terminate()
+
+# Der Pool lebt so lange wie der Worker-Prozess und wird erst beim Beenden geschlossen
+atexit.register(terminate_db_pool)
 
 def with_db_pool(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
         await init_db_pool()
-        try:
-            return await func(*args, **kwargs)
-        finally:
-            await close_db_pool()
+        return await func(*args, **kwargs)
     return wrapper
 
+async def gather_bounded(items, worker, limit=None):
+    """Run ``worker`` for every item with at most ``limit`` calls in flight.
+
+    Results are returned in the order of ``items``. A failing item yields its
+    exception in place of a result so the remaining items still complete.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit or config["llm_concurrency"]))
+
+    async def run(item):
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
 async def execute_with_retry(query, *args, max_retries=3, retry_delay=1, fetch_type=None):
     for attempt in range(max_retries):
         try:
             async with db_pool.acquire() as conn:
-                if fetch_type == 'row':
-                    return await conn.fetchrow(query, *args)
-                elif fetch_type == 'value':
-                    return await conn.fetchval(query, *args)
-                elif fetch_type == 'all':
-                    return await conn.fetch(query, *args)
-                else:
-                    return await conn.execute(query, *args)
+                with telemetry.span("db_query"):
+                    if fetch_type == 'row':
+                        return await conn.fetchrow(query, *args)
+                    elif fetch_type == 'value':
+                        return await conn.fetchval(query, *args)
+                    elif fetch_type == 'all':
+                        return await conn.fetch(query, *args)
+                    else:
+                        return await conn.execute(query, *args)
         except asyncpg.exceptions.TooManyConnectionsError:
             if attempt == max_retries - 1:
                 raise
             await asyncio.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
+        except (asyncpg.exceptions.ConnectionDoesNotExistError, asyncpg.exceptions.InterfaceError) as e:
+            # Verbindung wurde serverseitig geschlossen, z.B. nach einem Neustart der Datenbank
+            logger.warning(f"Lost database connection, reconnecting: {str(e)}")
+            db_pool.mark_unhealthy()
+            if attempt == max_retries - 1:
+                raise
         except Exception as e:
             logger.error(f"Error executing query: {query}, args: {args}, error: {str(e)}")
             raise
@@ -325,20 +582,16 @@ class PageAnalysisResponse(BaseModel):
 
 async def analyze_page_for_toc(page_content, page_number):
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
+        result = await parse_structured(
             messages=[
                 {"role": "system", "content": "Analyze this page for table of contents content. Look for chapter listings WITH their corresponding page numbers. A valid TOC must have both chapter names and their respective page numbers."},
                 {"role": "user", "content": f"Page {page_number} content:\n\n{page_content[:1300]}..."}
             ],
             response_format=TOCAnalysis,
+            priority=PRIORITY_HIGH,
+            output_tokens=20,
         )
 
-        print(f"Raw API response for page {page_number}:")
-        print(completion.choices[0].message)
-
-        result = completion.choices[0].message.parsed
-
         print(f"Processed result for page {page_number}:")
         print(result)
 
@@ -350,24 +603,39 @@ async def analyze_page_for_toc(page_content, page_number):
         
     except Exception as e:
         logger.error(f"Error on page {page_number}: {e}")
-        # Return a default structure in case of an error
-        return {
-            "is_toc_page": False,
-            "has_chapter_names_with_page_numbers": False
-        }
+        telemetry.count("llm_fallbacks", kind="toc_page")
+        return local_toc_analysis(page_content)
+
+def local_toc_analysis(page_content):
+    """Decide an ambiguous page by its layout score alone, for when the LLM is not used."""
+    is_toc = score_toc_page(page_content) >= (config["toc_score_reject"] + config["toc_score_accept"]) / 2
+    return {
+        "is_toc_page": is_toc,
+        "has_chapter_names_with_page_numbers": is_toc
+    }
  
-async def find_toc_in_pdf(pdf_document):
+async def find_toc_in_pdf(pages):
     start_page = None
     end_page = None
-    max_pages = min(19, len(pdf_document))
+    max_pages = min(19, len(pages))
     consecutive_toc_pages = 0
     min_consecutive_pages = 2
 
+    llm_calls_saved = 0
+
     for page_number in range(max_pages):
-        page = pdf_document[page_number]
-        page_content = page.get_text()
-        
-        result = await analyze_page_for_toc(page_content, page_number + 1)
+        page_content = await asyncio.to_thread(pages.page, page_number)
+
+        # Clear cases are decided locally, only ambiguous pages go to the LLM
+        is_toc = classify_toc_page(page_content, config["toc_score_reject"], config["toc_score_accept"])
+        if is_toc is None and budget_allows("toc_probing"):
+            result = await analyze_page_for_toc(page_content, page_number + 1)
+        elif is_toc is None:
+            llm_calls_saved += 1
+            result = local_toc_analysis(page_content)
+        else:
+            llm_calls_saved += 1
+            result = {"is_toc_page": is_toc, "has_chapter_names_with_page_numbers": is_toc}
         print(f"Analysis result for page {page_number + 1}: {result}")
         
         if result["has_chapter_names_with_page_numbers"]:
@@ -384,68 +652,104 @@ async def find_toc_in_pdf(pdf_document):
                 consecutive_toc_pages = 0
 
     has_toc = consecutive_toc_pages >= min_consecutive_pages
+    logger.info(f"TOC scan decided {llm_calls_saved} pages without the LLM.")
 
     return {
         "has_toc": has_toc,
         "start_page": start_page if has_toc else None,
-        "end_page": end_page if has_toc else None
+        "end_page": end_page if has_toc else None,
+        "llm_calls_saved": llm_calls_saved
     }
 
 
-async def extract_text(json_input, pdf_document):
+async def extract_text(json_input, pages):
     has_toc = json_input.get('has_toc', False)
     start_page = json_input.get('start_page', 0)
-    end_page = json_input.get('end_page', len(pdf_document) - 1)
+    end_page = json_input.get('end_page', len(pages) - 1)
 
-    if start_page < 0 or end_page >= len(pdf_document) or start_page > end_page:
+    if start_page < 0 or end_page >= len(pages) or start_page > end_page:
         raise ValueError("Invalid start or end page.")
 
     if has_toc:
         start_page -= 1 
-    text = ""
-
-    for page_num in range(start_page, end_page + 1):
-        page = pdf_document[page_num]
-        text += page.get_text() + "\n"
 
-    return text
+    # Seiten lesen und bereinigen blockiert, also im Worker-Thread
+    return await asyncio.to_thread(pages.text, start_page, end_page + 1)
 
 # Definiere eine Klasse für einzelne Kapitelinformationen
 class ChapterInfo(BaseModel):
     chapter: str
     start_page: int
+    level: int = 1
 
 # Definiere die Klasse für strukturierte Antworten, die die Kapitelinformationen verwendet
 class TOCContents(BaseModel):
     chapters: list[ChapterInfo]
 
+def extract_outline_chapters(pdf_document):
+    """Build the chapter list from the PDF's embedded outline (bookmarks).
+
+    Starts with the top-level entries and includes deeper levels while the book
+    has fewer than ``outline_target_chapters`` chapters, as long as the next
+    level keeps the list within ``outline_max_chapters``. Outline page numbers
+    are physical 1-based pages. Returns None if the outline is missing or too
+    sparse to be useful.
+    """
+    num_pages = len(pdf_document)
+    entries = [
+        (level, title.strip(), page)
+        for level, title, page in pdf_document.get_toc(simple=True)
+        if title.strip() and 1 <= page <= num_pages
+    ]
+    if not entries:
+        return None
+
+    levels = sorted({level for level, _, _ in entries})
+    selected = [entry for entry in entries if entry[0] <= levels[0]]
+    for max_level in levels[1:]:
+        if len(selected) >= config["outline_target_chapters"]:
+            break
+        candidate = [entry for entry in entries if entry[0] <= max_level]
+        if len(candidate) > config["outline_max_chapters"]:
+            break
+        selected = candidate
+
+    # Keep one chapter per start page, preferring the outermost entry
+    chapters = []
+    seen_pages = set()
+    for level, title, page in sorted(selected, key=lambda entry: entry[2]):
+        if page in seen_pages:
+            continue
+        seen_pages.add(page)
+        chapters.append(ChapterInfo(chapter=title, start_page=page, level=level))
+
+    if len(chapters) < config["outline_min_chapters"]:
+        return None
+    return TOCContents(chapters=chapters)
+
 # Funktion zum Extrahieren des Inhaltsverzeichnisses
 async def extract_table_of_contents(text):
     try:
         system_message = (
             "Extract the main chapter names and their starting page numbers from the text."
             "Select approximately 15-30 important chapters, evenly distributed throughout the book. "
-            "Each chapter should be meaningful, concise, and listed as 'chapter' (string) and 'start_page' (integer). "
+            "Each chapter should be meaningful, concise, and listed as 'chapter' (string), 'start_page' (integer) and 'level' (integer, 1 for top-level chapters). "
             "Return the result as a structured list with 15 or more items."
             "Ensure that the selected chapters cover the entire span of the book, from beginning to end."
         )
 
         user_message = text
 
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
+        result = await parse_structured(
             messages=[
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": user_message}
             ],
-            response_format=TOCContents
+            response_format=TOCContents,
+            priority=PRIORITY_HIGH,
+            output_tokens=1500
         )
 
-        print("Raw API response:")
-        print(completion.choices[0].message)
-
-        result = completion.choices[0].message.parsed
-
         print("Processed result:")
         print(result)
 
@@ -459,9 +763,9 @@ class ClassificationResult(BaseModel):
     topic_id: int  
     confidence: float 
 
-async def classify_text(text: str, topics: List[Tuple[int, str]]) -> ClassificationResult:
-    # Erstelle die Kategorienliste als String
-    categories = "\n".join([f"{id}. {topic}" for id, topic in topics])
+async def classify_text(text: str, topics: TopicSnapshot, candidates=None) -> ClassificationResult:
+    # Erstelle die Kategorienliste als String, bei vielen Themen nur aus der Vorauswahl
+    categories = topics.categories_for(candidates) if candidates else topics.categories
 
     # Systemnachricht mit Anweisungen
     system_message = (
@@ -474,17 +778,15 @@ async def classify_text(text: str, topics: List[Tuple[int, str]]) -> Classificat
     # Benutzernachricht mit dem zu klassifizierenden Text
     user_message = text
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
+    result = await parse_structured(
         messages=[
             {"role": "system", "content": system_message},
             {"role": "user", "content": user_message}
         ],
-        response_format=ClassificationResult
+        response_format=ClassificationResult,
+        output_tokens=20
     )
 
-    result = response.choices[0].message.parsed
-
     return  {
         "topic_id": result.topic_id,
         "confidence": result.confidence
@@ -492,164 +794,912 @@ async def classify_text(text: str, topics: List[Tuple[int, str]]) -> Classificat
 
 
 
-async def standard_chunking(blob_client, book_id, pdf_document, n_chunks=15):
+def plan_chapters(chapters, num_pages):
+    """Turn TOC chapters into (name, start_page, end_page) tuples with 0-based pages."""
+    plan = []
+    for chapter in chapters:
+        start_page = chapter.start_page - 1  # Adjust for 0-based indexing
+        end_page = num_pages - 1  # Default to last page of document
+
+        # Find the end page (start of next chapter or end of document)
+        for next_chapter in chapters:
+            if next_chapter.start_page > start_page + 1:
+                end_page = next_chapter.start_page - 2
+                break
+
+        plan.append((chapter.chapter, start_page, end_page))
+    return plan
+
+async def preload_pages(pages, pdf_path, steps):
+    """Extract all pages in a process pool if the book is large enough to benefit.
+
+    The workers open the PDF from the downloaded file.
+    """
+    workers = config["extract_workers"]
+    if workers <= 1 or len(pages) < config["parallel_extract_min_pages"]:
+        return
+    loop = asyncio.get_running_loop()
+    started = time.time()
+    with telemetry.span("parallel_extraction"):
+        texts = await loop.run_in_executor(None, extract_pages_parallel, pdf_path, len(pages), workers)
+    pages.preload(texts)
+    steps.append(f"Extracted {len(pages)} pages with {workers} worker processes in {time.time() - started:.2f} seconds.")
+
+def use_streaming(num_pages):
+    mode = config["streaming_mode"]
+    return mode == "on" or (mode == "auto" and num_pages >= config["streaming_min_pages"])
+
+async def iter_texts(page_ranges, pages):
+    """Yield ``(index, text)`` for inclusive ``(start, end)`` page ranges, one range at a time.
+
+    An invalid range yields its ValueError in place of the text.
+    """
+    for index, (start_page, end_page) in enumerate(page_ranges):
+        try:
+            yield index, await extract_text({"start_page": start_page, "end_page": end_page}, pages)
+        except ValueError as e:
+            yield index, e
+
+def book_ranges(num_pages, n_chunks):
+    """Cut ``num_pages`` pages into ``n_chunks`` ranges ``(start, end)`` of equal length, end exclusive."""
+    chunk_size = math.ceil(num_pages / n_chunks)
+    return [(start, min(start + chunk_size, num_pages)) for start in range(0, num_pages, chunk_size)]
+
+def page_texts(pages, start_page, end_page):
+    """Yield ``(page, text)`` for the inclusive page range, each text followed by a newline as in ``pages.text``."""
+    for page in range(start_page, end_page + 1):
+        yield page, pages.page(page) + "\n"
+
+def split_pages(content, start_page, page_lengths):
+    """Cut text joined from consecutive pages back into ``(page, text)`` pairs."""
+    offset = 0
+    for page, length in enumerate(page_lengths, start_page):
+        yield page, content[offset:offset + length]
+        offset += length
+
+def plan_chunks(texts):
+    """Split ``(page, text)`` pairs into pieces of at most ``chunk_target_tokens`` tokens."""
+    return plan_pieces(texts, config["chunk_target_tokens"], config["chunk_overlap_tokens"])
+
+def piece_fingerprints(plan_name, texts):
+    """``(fingerprint, start_page, end_page)`` of every piece plan_chunks makes of ``texts``."""
+    return [(chunk_fingerprint(plan_name, piece.text), piece.start_page, piece.end_page) for piece in plan_chunks(texts)]
+
+def planned_pieces(plan_name, content, start_page, page_lengths):
+    """``(piece, fingerprint)`` for every piece plan_chunks makes of text joined from pages ``start_page`` on."""
+    return [(piece, chunk_fingerprint(plan_name, piece.text))
+            for piece in plan_chunks(split_pages(content, start_page, page_lengths))]
+
+def piece_title(chapter_name, part, piece):
+    """Chapter name for the first piece of a chapter, its heading or part number for the others."""
+    if part == 0:
+        return chapter_name
+    return f"{chapter_name}: {piece.heading}" if piece.heading else f"{chapter_name} ({part + 1})"
+
+async def text_windows(texts, budget_bytes):
+    """Group the ``(index, text)`` pairs of ``texts`` into lists of at most ``budget_bytes`` of text.
+
+    A text larger than the budget forms a window of its own.
+    """
+    window, size = [], 0
+    async for index, text in texts:
+        cost = 0 if isinstance(text, Exception) else sys.getsizeof(text)
+        if window and size + cost > budget_bytes:
+            yield window
+            window, size = [], 0
+        window.append((index, text))
+        size += cost
+    if window:
+        yield window
+
+async def release_window(writer):
+    """Move the chunks of a finished window to the staging table and empty MuPDF's object cache."""
+    await writer.spill()
+    with MUPDF_LOCK:
+        fitz.TOOLS.store_shrink(100)
+
+async def detect_chapters(pages, steps):
+    """Return the book's chapters as TOCContents, or None if no TOC was found.
+
+    The embedded PDF outline is used when available; the LLM based TOC page
+    detection only runs for books without a usable outline.
+    """
+    with MUPDF_LOCK:
+        outline = extract_outline_chapters(pages.document)
+    if outline is not None:
+        logger.info(f"Using PDF outline with {len(outline.chapters)} chapters.")
+        steps.append(f"PDF outline found with {len(outline.chapters)} chapters. Skipping table of contents detection.")
+        return outline
+
+    # Find table of contents
+    logger.info("Searching for table of contents")
+    with telemetry.span("toc_scan"):
+        toc_info = await find_toc_in_pdf(pages)
+    print("***********************************")
+    print(toc_info["has_toc"], toc_info["start_page"], toc_info["end_page"])
+
+    if not toc_info["has_toc"]:
+        return None
+
+    logger.info(f"Table of contents found from page {toc_info['start_page']} to {toc_info['end_page']}.")
+    steps.append(f"Table of contents found from page {toc_info['start_page']} to {toc_info['end_page']}.")
+
+    # Extract text from table of contents
+    logger.debug("Extracting text from table of contents")
+    toc_text = await extract_text(toc_info, pages)
+
+    # Extract chapter information
+    logger.info("Extracting chapter information from table of contents")
+    chapter_info = await extract_table_of_contents(toc_text)
+    logger.debug(f"Extracted {len(chapter_info.chapters)} chapters")
+    if not chapter_info.chapters:
+        steps.append("No chapters could be extracted from the table of contents, using fixed-size chunks.")
+        return None
+    return chapter_info
+
+async def fetch_labelled_chunks(limit):
+    """Fetch chunks classified by the LLM as (preprocessed text, topic_id, book_id) samples.
+
+    Locally classified chunks are left out, so the classifier is neither
+    trained nor evaluated on its own predictions. The newest books come first.
+    """
+    await ensure_chunk_columns()
+    rows = await execute_with_retry(
+        """
+        SELECT left(content, 20000) AS content, topic_id, book_id FROM chunk
+        WHERE topic_id IS NOT NULL AND classification_source = ANY($2::text[])
+        ORDER BY book_id DESC, startpage, endpage, chaptername
+        LIMIT $1
+        """,
+        limit, LLM_SOURCES,
+        fetch_type='all'
+    )
+    return [(preprocess_text(row['content']), row['topic_id'], row['book_id']) for row in rows]
+
+async def get_topic_classifier(topics):
+    """Return the local topic classifier, retraining it when the topic list changed."""
+    global topic_classifier, topic_classifier_key
+    key = (topics.topics, tuple(sorted(topics.descriptions.items())))
+    async with topic_classifier_lock:
+        if topic_classifier is None or topic_classifier_key != key:
+            labelled = []
+            if config["local_classifier_use_chunks"]:
+                labelled = [(text, topic_id) for text, topic_id, _ in await fetch_labelled_chunks(config["local_classifier_max_chunks"])]
+            loop = asyncio.get_running_loop()
+            topic_classifier = await loop.run_in_executor(None, TopicClassifier, topics, labelled, topics.descriptions)
+            topic_classifier_key = key
+    return topic_classifier
+
+def topic_shortlist(classifier, texts, topics):
+    """Topic ids offered to the LLM for ``texts``, or None to offer all topics.
+
+    With more than ``topic_shortlist_k`` topics, only the union of the
+    ``topic_shortlist_k`` locally most similar topics per text is offered, so
+    the prompt does not grow with the topic table.
+    """
+    k = config["topic_shortlist_k"]
+    if k <= 0 or len(topics) <= k:
+        return None
+    candidates = set()
+    for text in texts:
+        candidates.update(classifier.shortlist(text, k))
+    return sorted(candidates)
+
+async def classify_chapter(text, topics):
+    """Classify locally and only ask the LLM when the local confidence is too low.
+
+    If the LLM call fails after the scheduler's retries, or the job's time
+    budget is running out, a less confident local prediction is used instead.
+    """
+    result = None
+    candidates = None
+    if topics:
+        classifier = await get_topic_classifier(topics)
+        result = classifier.predict(text)
+        if result is not None and result["confidence"] >= config["local_classifier_threshold"]:
+            return {**result, "source": "local"}
+        if result is not None and not budget_allows("llm_classification"):
+            return {**result, "source": "local"}
+        candidates = topic_shortlist(classifier, [text], topics)
+    try:
+        return {**await classify_text(text, topics, candidates), "source": "llm"}
+    except Exception as e:
+        if result is None:
+            raise
+        logger.error(f"LLM classification failed, using the local prediction: {str(e) or type(e).__name__}")
+        telemetry.count("llm_fallbacks", kind="classification")
+        return {**result, "source": "local_fallback"}
+
+class ChunkAnalysis(BaseModel):
+    chunk_id: int
+    generated_title: str
+    is_relevant: bool
+    topic_id: int
+    confidence: float
+
+class BatchAnalysisResponse(BaseModel):
+    results: list[ChunkAnalysis]
+
+def estimate_tokens(text):
+    # Grobe Schätzung: etwa 4 Zeichen pro Token
+    return len(text) // 4 + 1
+
+def pack_batches(items, token_budget):
+    """Greedily pack (chunk_id, text) items into batches within ``token_budget`` tokens."""
+    batches = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item[1]) + 20
+        if current and current_tokens + tokens > token_budget:
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+async def analyze_chunk(text, topics, with_title):
+    """Title and classification for a single chunk, each with its own call."""
+    if not with_title:
+        return await classify_chapter(text, topics)
+    if not budget_allows("llm_titles"):
+        return {**await classify_chapter(text, topics), **HEADING_TITLE}
+    result, classification_result = await asyncio.gather(
+        generate_title_and_check_relevance(text),
+        classify_chapter(text, topics)
+    )
+    if result is None:
+        raise ValueError("Title generation failed")
+    return {**classification_result, **result}
+
+async def analyze_batch(batch, topics, with_titles):
+    """Analyze several chunks with one structured-output call.
+
+    Entries missing from the response are retried as a smaller batch, or split
+    in halves if the whole response failed; a single remaining chunk falls
+    back to the per-chunk calls, as do all chunks while the circuit breaker is
+    open or the job's time budget rules out LLM classification. Returns a dict
+    chunk_id -> result or exception.
+    """
+    skip_llm = not budget_allows("llm_classification")
+    batch_titles = with_titles and budget_allows("llm_titles")
+    candidates = topic_shortlist(await get_topic_classifier(topics), [text for _, text in batch], topics) if topics else None
+    categories = topics.categories_for(candidates) if candidates else topics.categories
+    system_message = (
+        "You receive several text sections, each introduced by '### Chunk <id>'. For every section "
+        + ("generate a short and concise title (maximum 5 words) in the same language as the text, " if batch_titles else "set generated_title to an empty string, ")
+        + "check if the text is relevant (it does not contain a glossary, table of contents, or any other irrelevant content) "
+        "and classify it into one of the given categories with the match percentage as confidence (where 1 represents 100%).\n\n"
+        f"Categories:\n{categories}\n\n"
+        "Return exactly one result per section with its chunk_id."
+    )
+    user_message = "\n\n".join(f"### Chunk {chunk_id}\n{text}" for chunk_id, text in batch)
+
+    by_id = {}
+    if not skip_llm:
+        try:
+            response = await parse_structured(
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": user_message}
+                ],
+                response_format=BatchAnalysisResponse,
+                output_tokens=40 * len(batch),
+                hedge=False
+            )
+            by_id = {result.chunk_id: result for result in response.results}
+        except CircuitOpenError:
+            skip_llm = True
+        except Exception as e:
+            logger.error(f"Error analyzing batch of {len(batch)} chunks: {str(e)}")
+
+    results = {
+        chunk_id: {**by_id[chunk_id].model_dump(exclude={"chunk_id"}), "source": "llm_batch"}
+        for chunk_id, _ in batch if chunk_id in by_id
+    }
+    missing = [item for item in batch if item[0] not in by_id]
+    if not missing:
+        return results
+
+    if len(missing) == 1 or skip_llm:
+        # Ohne LLM bleiben nur die Einzelaufrufe mit ihren lokalen Ersatzwerten
+        for chunk_id, text in missing:
+            try:
+                results[chunk_id] = await analyze_chunk(text, topics, with_titles)
+            except Exception as e:
+                results[chunk_id] = e
+    elif len(missing) < len(batch):
+        results.update(await analyze_batch(missing, topics, with_titles))
+    else:
+        middle = len(missing) // 2
+        for half in (missing[:middle], missing[middle:]):
+            results.update(await analyze_batch(half, topics, with_titles))
+    return results
+
+async def analyze_chunks(texts, topics, with_titles, on_result=None):
+    """Title, relevance and topic for preprocessed chunk texts, in input order.
+
+    Without ``llm_batch_mode`` every chunk gets its own calls. In batch mode the
+    local classifier runs first and the remaining chunks are packed into
+    requests of at most ``llm_batch_token_budget`` tokens. Failed chunks yield
+    their exception instead of a result. ``on_result(index, result)`` is
+    awaited for every successful chunk as soon as its result is known.
+    """
+    if not config["llm_batch_mode"] or len(texts) < 2:
+        async def analyze(item):
+            index, text = item
+            result = await analyze_chunk(text, topics, with_titles)
+            if on_result:
+                await on_result(index, result)
+            return result
+
+        return await gather_bounded(list(enumerate(texts)), analyze)
+
+    results = [None] * len(texts)
+    classifier = await get_topic_classifier(topics) if topics else None
+    pending = []
+    for index, text in enumerate(texts):
+        local = classifier.predict(text) if classifier else None
+        if not with_titles and local is not None and local["confidence"] >= config["local_classifier_threshold"]:
+            results[index] = {**local, "source": "local"}
+        else:
+            pending.append((index, text))
+            if local is not None and local["confidence"] >= config["local_classifier_threshold"]:
+                results[index] = {**local, "source": "local"}
+
+    batches = pack_batches(pending, config["llm_batch_token_budget"])
+    logger.info(f"Analyzing {len(pending)} chunks in {len(batches)} batched requests.")
+
+    async def run_batch(batch):
+        outcome = await analyze_batch(batch, topics, with_titles)
+        for index, _ in batch:
+            result = outcome[index]
+            if not isinstance(result, Exception) and results[index] is not None:
+                # Eine sichere lokale Klassifikation hat Vorrang vor dem Batch-Ergebnis
+                result = {**result, **results[index]}
+            results[index] = result
+            if on_result and not isinstance(result, Exception):
+                await on_result(index, result)
+
+    pending_ids = {index for index, _ in pending}
+    if on_result:
+        for index, result in enumerate(results):
+            if result is not None and index not in pending_ids:
+                await on_result(index, result)
+
+    outcomes = await gather_bounded(batches, run_batch)
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, Exception):
+            for index, _ in batch:
+                results[index] = outcome
+    return results
+
+async def analyze_with_checkpoints(texts_by_index, topics, with_titles, checkpoints, stage):
+    """Run analyze_chunks for the chunks without a checkpoint.
+
+    ``texts_by_index`` maps chunk index to preprocessed text. Returns a dict
+    index -> result (or exception) and the number of chunks resumed from
+    checkpoints of ``stage``.
+    """
+    results = {}
+    todo = []
+    for index, text in texts_by_index.items():
+        saved = checkpoints.get(stage, index) if checkpoints else None
+        if saved is not None:
+            results[index] = saved
+        else:
+            todo.append(index)
+    resumed = len(results)
+
+    async def save(position, result):
+        if checkpoints:
+            await checkpoints.save(stage, todo[position], result)
+
+    analyses = await analyze_chunks([texts_by_index[index] for index in todo], topics, with_titles, on_result=save)
+    results.update(zip(todo, analyses))
+    return results, resumed
+
+async def evaluate_classifier(thresholds, ks=()):
+    """Report agreement of the local classifier and recall of the topic shortlist against the stored chunk labels."""
+    topics = await fetch_topics()
+    labelled = await fetch_labelled_chunks(config["local_classifier_max_chunks"])
+    loop = asyncio.get_running_loop()
+    # Folds nach Buch, da sich die Stücke eines Kapitels überlappen und sein Thema teilen
+    return await loop.run_in_executor(
+        None, partial(
+            evaluate_topic_classifier, topics, [(text, topic_id) for text, topic_id, _ in labelled], thresholds,
+            ks=ks, descriptions=topics.descriptions, groups=[book_id for _, _, book_id in labelled]
+        )
+    )
+
+def prepare_chapters(window, chapter_plan, pages, kept):
+    """Local pass of chunk_chapter_window: relevance and page lengths of each chapter.
+
+    Returns ``{index: (text, relevance, page_lengths)}``, with the error of an
+    invalid page range in place of the tuple, and the preprocessed texts of
+    the relevant chapters by index.
+    """
+    prepared = {}
+    for index, chapter_content in window:
+        chapter_name, start_page, end_page = chapter_plan[index]
+        if isinstance(chapter_content, Exception):
+            prepared[index] = chapter_content
+            continue
+        if index in kept:
+            prepared[index] = (chapter_content, None, None)
+            continue
+        logger.info(f"Processing chapter: {chapter_name} (Pages {start_page + 1} to {end_page + 1})")
+        chapter_pages = pages.texts(start_page, end_page + 1)
+        relevance = relevanz_check(chapter_pages)
+        if not relevance["is_relevant"]:
+            logger.info(f"Skipping classification of {relevance['kind']} chapter: {chapter_name}")
+        # Nur die Seitenlängen behalten, die Stücke werden beim Speichern aus dem Kapiteltext geschnitten
+        prepared[index] = (chapter_content, relevance, [len(text) + 1 for text in chapter_pages])
+
+    relevant = {
+        index: preprocess_text(item[0])
+        for index, item in prepared.items()
+        if not isinstance(item, Exception) and item[1] and item[1]["is_relevant"]
+    }
+    return prepared, relevant
+
+async def chunk_chapter_window(window, chapter_plan, pages, topics, kept, fingerprints, checkpoints, writer, steps):
+    """Analyze the chapters of one window and queue their chunks in ``writer``.
+
+    ``window`` holds ``(index, text)`` pairs from iter_texts. A chapter is
+    classified once and stored as pieces from plan_chunks that share its
+    classification and name it as their ``parent_chapter``. ``fingerprints``
+    holds the ``(fingerprint, start_page, end_page)`` pieces of the chapters
+    in ``kept``. Returns the number of chapters restored from checkpoints.
+    """
+    # Local pass over the chapters, no LLM involved; it blocks, so it runs in a worker thread
+    prepared, relevant = await asyncio.to_thread(prepare_chapters, window, chapter_plan, pages, kept)
+
+    # Classify the relevant chapters, results stay in chapter order
+    with telemetry.stage("analysis"):
+        analysis_by_index, resumed = await analyze_with_checkpoints(relevant, topics, False, checkpoints, "chapter")
+
+    for index, item in prepared.items():
+        chapter_name, start_page, end_page = chapter_plan[index]
+        if index in kept:
+            for fingerprint, piece_start, piece_end in fingerprints[index]:
+                writer.keep(fingerprint, piece_start + 1, piece_end + 1)
+            continue
+
+        outcome = item if isinstance(item, Exception) else analysis_by_index.get(index)
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing chapter {chapter_name}: {str(outcome)}")
+            steps.append(f"Error processing chapter {chapter_name}: {str(outcome)}")
+            # Ungültige Seitenbereiche ändern sich bei einem neuen Versuch nicht
+            if not isinstance(item, Exception):
+                writer.failed += 1
+            continue
+
+        chapter_content, _, page_lengths = item
+        is_relevant = outcome is not None
+        classification_result = outcome if is_relevant else SKIPPED_CLASSIFICATION
+        print("***********************************")
+        print(classification_result)
+        topic_id = classification_result["topic_id"] if classification_result["topic_id"] in topics.ids else None
+        confidence = classification_result["confidence"]
+        usage_count = 0
+
+        # Queue the chapter's pieces for the bulk insert
+        pieces = await asyncio.to_thread(planned_pieces, chapter_name, chapter_content, start_page, page_lengths)
+        for part, (piece, fingerprint) in enumerate(pieces):
+            writer.add(piece.start_page + 1, piece.end_page + 1, is_relevant, piece_title(chapter_name, part, piece), piece.text,
+                       topic_id, confidence, usage_count, fingerprint, chapter_name, classification_result["source"])
+
+        steps.append(
+                    f"➡️Chapter Report [Chapter: {chapter_name}]|"
+                    f" Pages: {start_page} - {end_page}|"
+                    f" Pieces: {len(pieces)}|"
+                    f" Topic ID: {topic_id}|"
+                    f" Confidence: {confidence:.2f}|"
+                    f" Classified by: {classification_result['source']}|"
+                    f" Relevant: {is_relevant}"
+                )
+
+        logger.debug(f"Processed chapter: {chapter_name}")
+    return resumed
+
+def prepare_ranges(window, page_ranges, pages, kept):
+    """Local pass of chunk_range_window, see prepare_chapters."""
+    prepared = {}
+    for index, content in window:
+        start, end = page_ranges[index]
+        if index in kept:
+            prepared[index] = (content, None, None)
+            continue
+        range_pages = pages.texts(start, end)
+        prepared[index] = (content, relevanz_check(range_pages), [len(text) + 1 for text in range_pages])
+
+    # Register, Glossar usw. brauchen weder Titel noch Klassifikation
+    relevant = {
+        index: preprocess_text(content)
+        for index, (content, relevance, _) in prepared.items() if relevance and relevance["is_relevant"]
+    }
+    return prepared, relevant
+
+async def chunk_range_window(window, page_ranges, pages, topics, kept, fingerprints, checkpoints, writer, steps):
+    """Fixed-size counterpart of chunk_chapter_window; titles are generated by the LLM.
+
+    The generated title of a page range is the ``parent_chapter`` of its pieces.
+    """
+    # Local pass over the page texts in a worker thread, no LLM involved
+    prepared, relevant = await asyncio.to_thread(prepare_ranges, window, page_ranges, pages, kept)
+
+    with telemetry.stage("analysis"):
+        analysis_by_index, resumed = await analyze_with_checkpoints(relevant, topics, True, checkpoints, "range")
+
+    for index, (content, relevance, page_lengths) in prepared.items():
+        start, end = page_ranges[index]
+        if index in kept:
+            for fingerprint, piece_start, piece_end in fingerprints[index]:
+                writer.keep(fingerprint, piece_start + 1, piece_end + 1)
+            steps.append(f"Unchanged pages {start + 1} - {end}: kept stored chunks.")
+            continue
+
+        outcome = analysis_by_index.get(index)
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing pages {start + 1} - {end}: {str(outcome)}")
+            steps.append(f"Error processing pages {start + 1} - {end}: {str(outcome)}")
+            writer.failed += 1
+            continue
+
+        if outcome is None:
+            chapter_name = first_heading(content) or relevance["kind"]
+            is_relevant = False
+            classification_result = SKIPPED_CLASSIFICATION
+        else:
+            chapter_name = outcome["generated_title"] or first_heading(content) or ""
+            is_relevant = outcome["is_relevant"]
+            classification_result = outcome
+        topic_id = classification_result["topic_id"] if classification_result["topic_id"] in topics.ids else None
+        confidence = classification_result["confidence"]
+        usage_count = 0
+
+        # Queue the range's pieces for the bulk insert
+        pieces = await asyncio.to_thread(planned_pieces, "", content, start, page_lengths)
+        for part, (piece, fingerprint) in enumerate(pieces):
+            writer.add(piece.start_page + 1, piece.end_page + 1, is_relevant, piece_title(chapter_name, part, piece), piece.text,
+                       topic_id, confidence, usage_count, fingerprint, chapter_name, classification_result["source"])
+        steps.append(
+                            f"➡️Chapter Report [Chapter: {chapter_name}]|"
+                            f" Pages: {start + 1} - {end}|"
+                            f" Pieces: {len(pieces)}|"
+                            f" Topic ID: {topic_id}|"
+                            f" Confidence: {confidence:.2f}|"
+                            f" Classified by: {classification_result['source']}|"
+                            f" Relevant: {is_relevant}"
+
+                        )
+    return resumed
+
+async def standard_chunking(blob_client, book_id, pages, n_chunks=15, writer=None, checkpoints=None, stored_fingerprints=frozenset(),
+                            window_bytes=math.inf):
     logger.info(f"Starting standard chunking process for book_id: {book_id}")
     steps = []
+    owns_writer = writer is None
+    if owns_writer:
+        writer = ChunkWriter(book_id)
     try:
-        num_pages = len(pdf_document)
-        chunk_size = math.ceil(num_pages / n_chunks)
-        
-        logger.info(f"PDF has {num_pages} pages. Chunk size: {chunk_size}")
+        num_pages = len(pages)
+        page_ranges = book_ranges(num_pages, n_chunks)
+
+        logger.info(f"PDF has {num_pages} pages. Chunk size: {math.ceil(num_pages / n_chunks)}")
         steps.append(f"PDF chunking into {n_chunks} chunks.")
-        
+
         # Fetch topic IDs for classification
         topics = await fetch_topics()
-        topic_ids = [int(topic[0]) for topic in topics]
 
-        
-        for start in range(0, num_pages, chunk_size):
-            end = min(start + chunk_size, num_pages)
-            content = ''
-            for page_num in range(start, end):
-                page = pdf_document[page_num]
-                content += page.get_text() + "\n"
-                content = content.replace('\x00', '')  # Entferne Null-Bytes
-                content = content.encode('utf-8', 'replace').decode('utf-8')  # Ersetze ungültige Zeichen mit '?'
-
-            preprocced_text = preprocess_text(content)
-
-                
-            # Generate title, classify content
-            result = await generate_title_and_check_relevance(preprocced_text)
-            chapter_name = result["generated_title"]
-            is_relevant = result["is_relevant"]
-            classification_result = await classify_text(preprocced_text, topics)
-            topic_id = classification_result["topic_id"] if classification_result["topic_id"] in topic_ids else None
-            confidence = classification_result["confidence"]
-            usage_count = 0
-            
-            # Insert chunk into the database
-            await insert_chunk(book_id, start + 1, end, is_relevant , chapter_name, content, topic_id, confidence, usage_count)
-            steps.append(
-                                f"➡️Chapter Report [Chapter: {chapter_name}]|"
-                                f" Pages: {start + 1} - {end}|"
-                                f" Topic ID: {topic_id}|"
-                                f" Confidence: {confidence:.2f}|"
-                                f" Relevant: {is_relevant}"
-                                
-                            )
-        
+        text_ranges = [(start, end - 1) for start, end in page_ranges]
+
+        # Page ranges whose pieces are unchanged keep their stored chunks; their texts are not kept
+        fingerprints = {}
+        kept = set()
+        if stored_fingerprints:
+            for index, (start, end) in enumerate(text_ranges):
+                fingerprints[index] = await asyncio.to_thread(piece_fingerprints, "", page_texts(pages, start, end))
+            kept = reusable_chapters(fingerprints, stored_fingerprints)
+
+        resumed = 0
+        async for window in text_windows(iter_texts(text_ranges, pages), window_bytes):
+            resumed += await chunk_range_window(window, page_ranges, pages, topics, kept, fingerprints, checkpoints, writer, steps)
+            if writer.staged:
+                await release_window(writer)
+        if resumed:
+            steps.append(f"Resumed {resumed} chunks from checkpoints.")
+
+        if owns_writer and (writer.pending or writer.kept):
+            stored = await writer.flush()
+            steps.append(f"Stored {stored} chunks.")
+
     except Exception as e:
         logger.error(f"Error during standard chunking: {str(e)}", exc_info=True)
         steps.append(f"Error during standard chunking: {str(e)}")
+        writer.failed += 1
     
     return steps
 
 
-async def intelligent_chunking(blob_client, book_id):
+async def intelligent_chunking(blob_client, book_id, replace_existing=False, steps=None, force_rebuild=False, allow_partial=True):
+    """Chunk a book along its chapters, falling back to fixed-size chunks.
+
+    The chapter plan and every analyzed chunk are checkpointed, so a rerun
+    after a failure only repeats the missing work; ``force_rebuild`` discards
+    the checkpoints first. Without ``allow_partial`` failed chunks raise
+    IncompleteChunkingError instead of storing an incomplete book.
+
+    With ``replace_existing`` (and no ``force_rebuild``) stored chunks whose
+    content fingerprint matches a planned chunk are kept as they are, so a
+    revised edition only re-processes the chapters that changed.
+
+    Books with at least ``streaming_min_pages`` pages are processed in
+    streaming mode: page texts are not cached, chapters are analyzed in windows
+    of at most ``memory_budget_mb`` of text, and each finished window is moved
+    to the staging table before the next one is read.
+    """
     logger.info(f"Starting intelligent chunking for book_id: {book_id}")
-    steps = []
+    # Fortschritt landet direkt in der übergebenen Liste, damit der Job-Heartbeat ihn sieht
+    steps = [] if steps is None else steps
     try:
         steps.append("Initiating intelligent chunking process.")
         logger.debug("Initiating intelligent chunking process.")
         
-        # Download PDF content
+        # Download PDF content to a temporary file and open it from there
         logger.info(f"Downloading PDF content for book_id: {book_id}")
-        blob_data = blob_client.download_blob()
-        pdf_bytes = blob_data.readall()
-        logger.debug(f"PDF content downloaded successfully for book_id: {book_id}")
-        
-        # Open PDF document
-        logger.info(f"Opening PDF document for book_id: {book_id}")
-        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        async with open_blob_pdf(blob_client, config["blob_download_concurrency"]) as (pdf_path, pdf_document):
             logger.debug(f"PDF document opened successfully for book_id: {book_id}")
-            
-            # Find table of contents
-            logger.info("Searching for table of contents")
-            toc_info = await find_toc_in_pdf(pdf_document)
-            print("***********************************")
-            print(toc_info["has_toc"], toc_info["start_page"], toc_info["end_page"])
-            
-            if toc_info["has_toc"]:
-                logger.info(f"Table of contents found from page {toc_info['start_page']} to {toc_info['end_page']}.")
-                steps.append(f"Table of contents found from page {toc_info['start_page']} to {toc_info['end_page']}.")
-                
-                # Extract text from table of contents
-                logger.debug("Extracting text from table of contents")
-                toc_text = await extract_text(toc_info, pdf_document)
-                
-                # Extract chapter information
-                logger.info("Extracting chapter information from table of contents")
-                chapter_info = await extract_table_of_contents(toc_text)
-                logger.debug(f"Extracted {len(chapter_info.chapters)} chapters")
+            # Im Streaming-Modus werden Seiten nicht zwischengespeichert und Chunks früh ausgelagert
+            streaming = use_streaming(len(pdf_document))
+            pages = PageTextStore(pdf_document, cache=not streaming)
+            writer = ChunkWriter(book_id, replace_existing=replace_existing, staged=streaming)
+            loop = asyncio.get_running_loop()
+            checkpoints = CheckpointStore(db_pool, book_id, await loop.run_in_executor(None, file_fingerprint, pdf_path))
+            if await checkpoints.load(force_rebuild):
+                steps.append("Resuming from checkpoints of a previous run.")
+            elif force_rebuild:
+                steps.append("Forced rebuild: discarded existing checkpoints.")
+            if streaming:
+                window_bytes = config["memory_budget_mb"] * 1024 * 1024
+                steps.append(f"Streaming mode for {len(pages)} pages with a budget of {config['memory_budget_mb']} MB of text at a time.")
+            else:
+                window_bytes = math.inf
+                await preload_pages(pages, pdf_path, steps)
+
+            stored_fingerprints = frozenset()
+            if replace_existing and not force_rebuild and config["incremental_rechunking"]:
+                stored_fingerprints = await fetch_chunk_fingerprints(book_id)
+            else:
+                await ensure_chunk_columns()
+            if streaming:
+                await writer.reset_staging()
+
+            # Find chapters via the PDF outline or the table of contents
+            saved_plan = checkpoints.get("plan")
+            if saved_plan is not None:
+                chapter_plan = [tuple(chapter) for chapter in saved_plan["chapters"]] if saved_plan["chapters"] is not None else None
+                steps.append(f"Chapter plan restored from checkpoint ({len(chapter_plan) if chapter_plan else 'no'} chapters).")
+            else:
+                with telemetry.stage("chapter_detection"):
+                    chapter_info = await detect_chapters(pages, steps)
+                chapter_plan = plan_chapters(chapter_info.chapters, len(pages)) if chapter_info is not None else None
+                await checkpoints.save("plan", "", {"chapters": chapter_plan})
 
+            if chapter_plan is not None:
                 logger.info("Fetching topics for classification")
                 topics = await fetch_topics()
-                topic_ids = [int(topic[0]) for topic in topics]
-                print("TOPIC IDS")
-                print(topic_ids)
 
                 logger.debug(f"Fetched {len(topics)} topics for classification")
 
-                # Process each chapter
-                for chapter in chapter_info.chapters:
-                    chapter_name = chapter.chapter
-                    start_page = chapter.start_page - 1  # Adjust for 0-based indexing
-                    end_page = len(pdf_document) - 1  # Default to last page of document
-                    
-                    # Find the end page (start of next chapter or end of document)
-                    for next_chapter in chapter_info.chapters:
-                        if next_chapter.start_page > start_page + 1:
-                            end_page = next_chapter.start_page - 2
-                            break
-                    
-                    logger.info(f"Processing chapter: {chapter_name} (Pages {start_page + 1} to {end_page + 1})")
-                    
-                    # Extract chapter content
-                    logger.debug(f"Extracting content for chapter: {chapter_name}")
-                    chapter_content = await extract_text({"start_page": start_page, "end_page": end_page}, pdf_document)
-                    
-                    logger.info(f"Classifying content for chapter: {chapter_name}")
-                    classification_result = await classify_text(preprocess_text(chapter_content), topics)
-                    print("***********************************")
-                    print(classification_result)
-                    topic_id = classification_result["topic_id"] if classification_result["topic_id"] in topic_ids else None
-                    confidence = classification_result["confidence"]
-                    usage_count = 0
-
-                    logger.info(f"Inserting chunk for chapter: {chapter_name}")
-                    # Insert chunk into database
-                    await insert_chunk(book_id, start_page + 1, end_page + 1, True, chapter_name, chapter_content, topic_id, confidence, usage_count)
-                    
-                    steps.append(
-                                f"➡️Chapter Report [Chapter: {chapter_name}]|"
-                                f" Pages: {start_page} - {end_page}|"
-                                f" Topic ID: {topic_id}|"
-                                f" Confidence: {confidence:.2f}|"
-                                
-                            )
-
-
-                    logger.debug(f"Processed and stored chapter: {chapter_name}")
+                # Find the chapters whose pieces did not change; their texts are not kept
+                page_ranges = [(start_page, end_page) for _, start_page, end_page in chapter_plan]
+                fingerprints = {}
+                kept = set()
+                if stored_fingerprints:
+                    for index, (chapter_name, start_page, end_page) in enumerate(chapter_plan):
+                        if 0 <= start_page <= end_page < len(pages):
+                            fingerprints[index] = await asyncio.to_thread(piece_fingerprints, chapter_name,
+                                                                          page_texts(pages, start_page, end_page))
+                    kept = reusable_chapters(fingerprints, stored_fingerprints)
+                if kept:
+                    steps.append(f"{len(kept)} of {len(chapter_plan)} chapters are unchanged and keep their stored chunks.")
+
+                # Without streaming the whole book is a single window
+                resumed = 0
+                async for window in text_windows(iter_texts(page_ranges, pages), window_bytes):
+                    resumed += await chunk_chapter_window(window, chapter_plan, pages, topics, kept, fingerprints, checkpoints, writer, steps)
+                    if writer.staged:
+                        await release_window(writer)
+                if resumed:
+                    steps.append(f"Resumed {resumed} chapters from checkpoints.")
             else:
                 logger.warning("No table of contents found. Falling back to old chunking logic.")
                 steps.append("No table of contents found. Falling back to old chunking logic.")
-                steps.extend(await standard_chunking(blob_client, book_id, pdf_document))
-        
+                steps.extend(await standard_chunking(blob_client, book_id, pages, writer=writer, checkpoints=checkpoints,
+                                                     stored_fingerprints=stored_fingerprints, window_bytes=window_bytes))
+
+        budget = current_budget()
+        if writer.failed and budget is not None and budget.remaining() <= 0:
+            # Ein weiterer Versuch hätte wieder kein Budget, also das Erreichte speichern
+            steps.append(f"Time budget spent, storing the book without {writer.failed} failed chunks.")
+            allow_partial = True
+        if writer.failed and not allow_partial:
+            raise IncompleteChunkingError(f"{writer.failed} chunks failed; {writer.pending} completed chunks are checkpointed.")
+
+        if writer.pending or writer.kept:
+            kept_count = len(writer.kept)
+            stored = await writer.flush()
+            if kept_count:
+                steps.append(f"Stored {stored} new or changed chunks and kept {kept_count} unchanged ones.")
+            else:
+                steps.append(f"Stored {stored} chunks{' replacing the existing ones' if replace_existing else ''}.")
+        else:
+            steps.append("No chunks were produced. Existing chunks were left unchanged.")
+        await checkpoints.clear()
+
         logger.info(f"Intelligent chunking completed successfully for book_id {book_id}")
         steps.append("Intelligent chunking process completed.")
         
     except Exception as e:
         logger.error(f"Error during intelligent chunking for book_id {book_id}: {str(e)}", exc_info=True)
         steps.append(f"Error during intelligent chunking: {str(e)}")
+        if not allow_partial:
+            raise
     
     return steps
 
+async def run_chunking(book_id, replace_existing, steps, force_rebuild=False, allow_partial=True):
+    """Chunk one book and append the progress to ``steps``.
+
+    Raises LookupError if the book does not exist.
+    """
+    global client
+    if client is None:
+        client = setup_openai_client()
+
+    azure_blob = await fetch_data_by_id_as_json("book", id_value=book_id)
+    if not azure_blob:
+        raise LookupError(f"Unable to retrieve book data for book_id {book_id} from the database.")
+    book_url = dict(azure_blob)["url"]
+
+    blob_service_client = get_blob_service_client(config["azure_storage_connection_string"])
+    blob_client = blob_service_client.get_blob_client(container=config["azure_container_name"], blob=book_url)
+
+    if await check_if_chunks_exist(book_id):
+        if replace_existing:
+            logger.info(f"Existing chunks found for book_id {book_id}. Overwriting as requested.")
+            steps.append("Existing chunks found. Initiating overwrite process.")
+            await intelligent_chunking(blob_client, book_id, replace_existing=True, steps=steps,
+                                       force_rebuild=force_rebuild, allow_partial=allow_partial)
+        else:
+            logger.info(f"Chunks already exist for book_id {book_id}. Skipping generation as overwrite is set to False.")
+            steps.append("Existing chunks found. Skipping generation due to overwrite settings.")
+    else:
+        logger.info(f"No existing chunks found for book_id {book_id}. Initiating intelligent chunk generation.")
+        steps.append("No existing chunks found. Starting intelligent chunk generation process.")
+        await intelligent_chunking(blob_client, book_id, steps=steps,
+                                   force_rebuild=force_rebuild, allow_partial=allow_partial)
+    return steps
+
+def job_metrics(trace, budget=None):
+    """Stage timings, token counts, DB round trips and degradations of one job for its status record."""
+    if trace is None or not telemetry.enabled:
+        return None
+    metrics = trace.summary()
+    metrics["rss_mb"] = round(psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024, 1)
+    if budget is not None:
+        metrics["degradations"] = budget.degradations
+    return metrics
+
+async def run_job(job, worker_id, deadline=None):
+    """Process a claimed job while a heartbeat publishes its steps and keeps the lease.
+
+    The job runs with a TimeBudget up to ``deadline`` (a ``time.time()``
+    value), by default the host timeout minus ``job_deadline_margin_seconds``
+    from now, degrading relative to that full span. The degradations applied
+    are listed in ``steps`` and ``metrics``.
+    """
+    job_id = job["job_id"]
+    steps = []
+    stop = asyncio.Event()
+
+    async def keep_alive():
+        while True:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=config["job_heartbeat_seconds"])
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                if not await heartbeat(db_pool, job_id, worker_id, steps):
+                    logger.warning(f"Lost the lease on job {job_id}; another worker took it over.")
+            except Exception as e:
+                logger.error(f"Heartbeat for job {job_id} failed: {str(e)}")
+
+    heartbeat_task = asyncio.create_task(keep_alive())
+    if config["memory_profiling"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    start_time = time.time()
+    if deadline is None:
+        deadline = start_time + config["function_timeout_seconds"] - config["job_deadline_margin_seconds"]
+    trace = None
+    budget = None
+    try:
+        with telemetry.trace() as trace, telemetry.span("book"), time_budget(deadline - start_time, config["function_timeout_seconds"] - config["job_deadline_margin_seconds"]) as budget:
+            steps.append(f"Time budget: {budget.seconds:.0f} seconds.")
+            # Nur der letzte Versuch speichert ein Buch mit fehlgeschlagenen Kapiteln
+            await run_chunking(job["book_id"], job["replace_existing"], steps, job["force_rebuild"],
+                               allow_partial=job["attempts"] >= config["job_max_attempts"])
+        ram_usage = psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024  # Convert to MB
+        logger.info(f"RAM usage at the end of processing: {ram_usage:.2f} MB")
+        if llm_cache:
+            steps.append(f"LLM cache: {json.dumps(llm_cache.stats())}")
+        if llm_scheduler:
+            steps.append(f"LLM scheduler: {json.dumps(llm_scheduler.stats())}")
+        if budget.degradations:
+            steps.append(f"Degraded to meet the time budget: {', '.join(budget.degradations)}.")
+        steps.append(f"Job finished in {time.time() - start_time:.2f} seconds, RAM usage {ram_usage:.2f} MB.")
+        await complete_job(db_pool, job_id, worker_id, steps, job_metrics(trace, budget))
+        logger.info(f"Job {job_id} for book_id {job['book_id']} completed.")
+    except Exception as e:
+        logger.error(f"Job {job_id} for book_id {job['book_id']} failed: {str(e)}", exc_info=True)
+        steps.append(f"Error: {str(e)}")
+        retry_delay = None
+        if not isinstance(e, LookupError) and job["attempts"] < config["job_max_attempts"]:
+            retry_delay = config["job_retry_delay_seconds"] * (2 ** (job["attempts"] - 1))
+        if budget is not None and budget.degradations:
+            steps.append(f"Degraded to meet the time budget: {', '.join(budget.degradations)}.")
+        await fail_job(db_pool, job_id, worker_id, steps, str(e), retry_delay, job_metrics(trace, budget))
+    finally:
+        stop.set()
+        await heartbeat_task
+        gc.collect()
+
+async def process_job_queue():
+    """Claim and run queued jobs until the queue is empty or the time budget is spent.
+
+    Up to ``job_worker_concurrency`` books are processed at once. The timer
+    trigger runs on a single instance, so SKIP LOCKED only keeps these slots
+    (and an overlapping host) from claiming the same job.
+    """
+    await ensure_job_schema(db_pool)
+    worker_id = f"{os.getenv('WEBSITE_INSTANCE_ID', 'local')[:12]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    started = time.time()
+    deadline = started + config["job_worker_max_seconds"]
+    # Danach beendet der Host die Funktion, samt aller laufenden Jobs
+    job_deadline = started + config["function_timeout_seconds"] - config["job_deadline_margin_seconds"]
+    processed = 0
+
+    async def slot():
+        nonlocal processed
+        while time.time() < deadline:
+            job = await claim_job(db_pool, worker_id, config["job_lease_seconds"], config["job_max_attempts"])
+            if job is None:
+                return
+            await run_job(job, worker_id, job_deadline)
+            processed += 1
+
+    await asyncio.gather(*(slot() for _ in range(max(1, config["job_worker_concurrency"]))))
+    logger.info(f"Worker {worker_id} processed {processed} jobs. Database pool: {json.dumps(db_pool.metrics())}")
+    return processed
+
+@with_db_pool
+async def worker_main(timer: TimerRequest) -> None:
+    if timer.past_due:
+        logger.info("Chunking worker timer is past due.")
+    await process_job_queue()
+
+def json_response(body, status_code, headers):
+    return HttpResponse(json.dumps(body), status_code=status_code, mimetype="application/json", headers=headers)
+
 @with_db_pool
 async def main(req: HttpRequest) -> HttpResponse:
-    global client
     correlation_id = str(uuid.uuid4())
-    start_time = time.time()
     logger.info(f"Starting request processing. Correlation ID: {correlation_id}")
 
     cors_headers = {
@@ -661,7 +1711,37 @@ async def main(req: HttpRequest) -> HttpResponse:
     if req.method == 'OPTIONS':
         return HttpResponse(status_code=200, headers=cors_headers)
 
+    if req.params.get('action') == 'evaluate_classifier':
+        thresholds = [float(value) for value in req.params.get('thresholds', '0.3,0.4,0.5,0.6,0.7,0.8,0.9').split(',')]
+        ks = [int(value) for value in req.params.get('k', f"5,10,{config['topic_shortlist_k']}").split(',')]
+        report = await evaluate_classifier(thresholds, ks)
+        return json_response({"status": "success", "correlation_id": correlation_id, "evaluation": report}, 200, cors_headers)
+
+    if req.params.get('action') == 'pool_metrics':
+        return json_response({
+            "status": "success",
+            "correlation_id": correlation_id,
+            "db_pool": db_pool.metrics(),
+            "topic_catalog": topic_catalog.stats() if topic_catalog else None
+        }, 200, cors_headers)
+
+    if req.params.get('action') == 'metrics':
+        return HttpResponse(telemetry.prometheus(), status_code=200, mimetype="text/plain", headers={
+            **cors_headers, 'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+        })
+
+    if req.params.get('action') == 'status':
+        job_id = req.params.get('job_id')
+        if not job_id:
+            return json_response({"error": "Please provide a job_id in the query string"}, 400, cors_headers)
+        await ensure_job_schema(db_pool)
+        job = await get_job(db_pool, job_id)
+        if job is None:
+            return json_response({"error": f"Unknown job_id {job_id}", "status": "error"}, 404, cors_headers)
+        return json_response({**job, "correlation_id": correlation_id}, 200, cors_headers)
+
     book_id = req.params.get('book_id')
+    req_body = {}
     
     if not book_id:
         try:
@@ -672,108 +1752,40 @@ async def main(req: HttpRequest) -> HttpResponse:
     
     if not book_id:
         logger.error("No book_id provided")
-        return HttpResponse(
-            json.dumps({"error": "Please provide a book_id in the query string or request body"}),
-            status_code=400,
-            mimetype="application/json",
-            headers=cors_headers
-        )
+        return json_response({"error": "Please provide a book_id in the query string or request body"}, 400, cors_headers)
     
     try:
         book_id = int(book_id)
     except ValueError:
         logger.error(f"Invalid book_id: {book_id}")
-        return HttpResponse(
-            json.dumps({"error": "Invalid book_id. Must be an integer."}),
-            status_code=400,
-            mimetype="application/json",
-            headers=cors_headers
-        )
+        return json_response({"error": "Invalid book_id. Must be an integer."}, 400, cors_headers)
 
     try:
-        client = setup_openai_client()
-
-        
-        azure_blob = await fetch_data_by_id_as_json("book", id_value=book_id)
-        if azure_blob:
-            book_data = dict(azure_blob)
-            book_url = book_data["url"]
-            
-            steps = []
-            
-            blob_service_client = BlobServiceClient.from_connection_string(config["azure_storage_connection_string"])
-            blob_client = blob_service_client.get_blob_client(container=config["azure_container_name"], blob=book_url)
-            
-            overwrite_existing = os.getenv('OVERWRITE_EXISTING', 'False').lower() == 'true'
-            
-            if await check_if_chunks_exist(book_id):
-                if overwrite_existing:
-                    logger.info(f"Existing chunks found for book_id {book_id}. Overwriting as requested.")
-                    steps.append("Existing chunks found. Initiating overwrite process.")
-                    await delete_existing_chunks(book_id)
-                    steps.append("Existing chunks deleted successfully.")
-                    steps.extend(await intelligent_chunking(blob_client, book_id))
-                else:
-                    logger.info(f"Chunks already exist for book_id {book_id}. Skipping generation as overwrite is set to False.")
-                    steps.append("Existing chunks found. Skipping generation due to overwrite settings.")
-            else:
-                logger.info(f"No existing chunks found for book_id {book_id}. Initiating intelligent chunk generation.")
-                steps.append("No existing chunks found. Starting intelligent chunk generation process.")
-                steps.extend(await intelligent_chunking(blob_client, book_id))
-            
-            logger.info(f"Processing completed successfully for book_id {book_id}")
-
-            process = psutil.Process(os.getpid())
-            memory_info = process.memory_info()
-            ram_usage = memory_info.rss / 1024 / 1024  # Convert to MB
-            logger.info(f"RAM usage at the end of processing: {ram_usage:.2f} MB")
-
-            end_time = time.time()
-            execution_time = end_time - start_time
-
-            return HttpResponse(
-                json.dumps({
-                    "message": f"PDF processing completed successfully for book_id {book_id}",
-                    "status": "success",
-                    "book_id": book_id,
-                    "steps": steps,
-                    "correlation_id": correlation_id,
-                    "ram_usage_mb": round(ram_usage, 2),
-                    "execution_time_seconds": round(execution_time, 2)
-                }),
-                status_code=200,
-                mimetype="application/json",
-                headers=cors_headers
-            )
-        else:
-            logger.error("Failed to retrieve book data from the database.")
-            return HttpResponse(
-                json.dumps({
-                    "error": "Unable to retrieve book data from the database.",
-                    "status": "error",
-                    "book_id": book_id,
-                    "correlation_id": correlation_id
-                }),
-                status_code=500,
-                mimetype="application/json",
-                headers=cors_headers
-            )
+        overwrite_existing = os.getenv('OVERWRITE_EXISTING', 'False').lower() == 'true'
+        force_rebuild = str(req.params.get('force_rebuild', req_body.get('force_rebuild', False))).lower() == 'true'
+        await ensure_job_schema(db_pool)
+        job_id, created = await enqueue_job(db_pool, book_id, overwrite_existing or force_rebuild, force_rebuild)
+        return json_response({
+            "message": f"PDF processing {'queued' if created else 'already in progress'} for book_id {book_id}",
+            "status": "accepted",
+            "book_id": book_id,
+            "job_id": job_id,
+            "status_url": f"{req.url.split('?')[0]}?action=status&job_id={job_id}",
+            "correlation_id": correlation_id
+        }, 202, cors_headers)
     except Exception as e:
         logger.error(f"Unhandled exception in main function: {str(e)}", exc_info=True)
-        return HttpResponse(
-            json.dumps({
-                "error": f"An unexpected error occurred during processing: {str(e)}",
-                "status": "error",
-                "book_id": book_id,
-                "correlation_id": correlation_id
-            }),
-            status_code=500,
-            mimetype="application/json",
-            headers=cors_headers
-        )
-    finally:
-        gc.collect()
+        return json_response({
+            "error": f"An unexpected error occurred while queueing the job: {str(e)}",
+            "status": "error",
+            "book_id": book_id,
+            "correlation_id": correlation_id
+        }, 500, cors_headers)
         
 # Azure Functions entry point
 async def azure_function_handler(req: HttpRequest) -> HttpResponse:
-    return await main(req)
\ No newline at end of file
+    return await main(req)
+
+# Entry point of the ChunkingWorker timer function
+async def worker_handler(timer: TimerRequest) -> None:
+    await worker_main(timer)
@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+
+import fitz
+
+from page_store import MUPDF_LOCK
+from telemetry import telemetry
+
+logger = logging.getLogger('PDFLogger')
+
+
+def download_blob_to_file(blob_client, path, max_concurrency):
+    """Stream a blob into ``path`` using parallel ranged requests.
+
+    The SDK downloads ``max_concurrency`` ranges at a time and writes each one
+    to the file at its offset, so memory use is bounded by the number of
+    ranges in flight and not by the blob size.
+    """
+    with open(path, "wb") as f:
+        downloader = blob_client.download_blob(max_concurrency=max_concurrency)
+        size = downloader.readinto(f)
+    logger.info(f"Downloaded {size / 1024 / 1024:.1f} MB to {path}")
+    return size
+
+
+async def download_blob_to_file_async(blob_client, path, max_concurrency):
+    """Async variant of download_blob_to_file for ``azure.storage.blob.aio`` clients."""
+    with open(path, "wb") as f:
+        downloader = await blob_client.download_blob(max_concurrency=max_concurrency)
+        size = await downloader.readinto(f)
+    logger.info(f"Downloaded {size / 1024 / 1024:.1f} MB to {path}")
+    return size
+
+
+@contextmanager
+def temporary_pdf_path():
+    """Yield a temporary file path for a downloaded PDF and delete it afterwards."""
+    handle, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(handle)
+    try:
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning(f"Could not remove temporary file {path}")
+
+
+@asynccontextmanager
+async def open_blob_pdf(blob_client, max_concurrency):
+    """Download a PDF blob to a temporary file and open it with PyMuPDF.
+
+    PyMuPDF reads pages from the file on demand, so the book never has to be
+    held in memory as a whole. Accepts sync and ``aio`` blob clients. Yields
+    ``(path, document)``.
+    """
+    with temporary_pdf_path() as path:
+        with telemetry.stage("download"):
+            if inspect.iscoroutinefunction(blob_client.download_blob):
+                size = await download_blob_to_file_async(blob_client, path, max_concurrency)
+            else:
+                loop = asyncio.get_running_loop()
+                size = await loop.run_in_executor(None, download_blob_to_file, blob_client, path, max_concurrency)
+        telemetry.count("download_bytes", size)
+        with telemetry.stage("pdf_open"), MUPDF_LOCK:
+            document = fitz.open(path)
+        try:
+            yield path, document
+        finally:
+            with MUPDF_LOCK:
+                document.close()
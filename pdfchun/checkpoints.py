@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger('PDFLogger')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunking_checkpoint (
+    book_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (book_id, stage, key)
+);
+"""
+
+schema_ready = False
+
+
+def file_fingerprint(path, block_size=1024 * 1024):
+    """SHA-256 of the downloaded PDF; checkpoints only apply to the same file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def ensure_checkpoint_schema(pool):
+    """Create the checkpoint table once per process."""
+    global schema_ready
+    if schema_ready:
+        return
+    await pool.execute(SCHEMA)
+    schema_ready = True
+
+
+class CheckpointStore:
+    """Per-book checkpoints of a chunking run, stored in Postgres.
+
+    Entries are addressed by ``(stage, key)``, e.g. ``("plan", "")`` for the
+    chapter plan or ``("chapter", "3")`` for the analysis of the fourth
+    chapter. Entries written for a different PDF fingerprint are discarded
+    when the store is loaded.
+    """
+
+    def __init__(self, pool, book_id, fingerprint):
+        self.pool = pool
+        self.book_id = book_id
+        self.fingerprint = fingerprint
+        self._entries = {}
+
+    async def load(self, force_rebuild=False):
+        """Load the checkpoints of the book; ``force_rebuild`` drops them instead."""
+        await ensure_checkpoint_schema(self.pool)
+        if force_rebuild:
+            await self.clear()
+            return 0
+        await self.pool.execute(
+            "DELETE FROM chunking_checkpoint WHERE book_id = $1 AND fingerprint <> $2",
+            self.book_id, self.fingerprint
+        )
+        rows = await self.pool.fetch(
+            "SELECT stage, key, payload FROM chunking_checkpoint WHERE book_id = $1",
+            self.book_id
+        )
+        self._entries = {(row["stage"], row["key"]): json.loads(row["payload"]) for row in rows}
+        if self._entries:
+            logger.info(f"Loaded {len(self._entries)} checkpoints for book_id {self.book_id}")
+        return len(self._entries)
+
+    def get(self, stage, key=""):
+        return self._entries.get((stage, str(key)))
+
+    async def save(self, stage, key, payload):
+        await self.pool.execute(
+            """
+            INSERT INTO chunking_checkpoint (book_id, stage, key, fingerprint, payload)
+            VALUES ($1, $2, $3, $4, $5::jsonb)
+            ON CONFLICT (book_id, stage, key)
+            DO UPDATE SET fingerprint = EXCLUDED.fingerprint, payload = EXCLUDED.payload, updated_at = now()
+            """,
+            self.book_id, stage, str(key), self.fingerprint, json.dumps(payload, ensure_ascii=False)
+        )
+        self._entries[(stage, str(key))] = payload
+
+    async def clear(self):
+        """Remove all checkpoints of the book, e.g. after its chunks were stored."""
+        await self.pool.execute("DELETE FROM chunking_checkpoint WHERE book_id = $1", self.book_id)
+        self._entries = {}
@@ -0,0 +1,132 @@
+import re
+from collections import namedtuple
+
+# Zerlegt Kapitel und Bücher in Stücke begrenzter Größe, bevorzugt an Überschriften und Absätzen
+
+CHARS_PER_TOKEN = 4
+HEADING = re.compile(r'^(\d{1,2}(\.\d{1,2}){0,3}\.?|[IVX]{1,4}\.|Kapitel \d+|Chapter \d+)\s+[^\W\d_]', re.IGNORECASE)
+SENTENCE_END = re.compile(r'[.!?:;]["\'»«“”)\]]?$')
+HEADING_MAX_CHARS = 80
+SHORT_LINE_RATIO = 0.75
+# Ein Stück wird erst ab diesem Anteil des Ziels an einer schwächeren Grenze beendet
+MIN_FILL = 0.5
+
+# Stärke der Grenze vor einer Zeile
+LINE, SENTENCE, PARAGRAPH, HEADING_BREAK = 0, 1, 2, 3
+
+Piece = namedtuple("Piece", ["start_page", "end_page", "text", "heading"])
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _is_heading(line):
+    return len(line) <= HEADING_MAX_CHARS and not line.endswith((".", ",")) and bool(HEADING.match(line))
+
+
+def _units(page_texts, max_tokens):
+    """Yield ``(strength, page, tokens, text)`` per line of ``(page_number, text)`` pairs.
+
+    ``strength`` rates the boundary before the line. Lines longer than
+    ``max_tokens`` are split at spaces into several units.
+    """
+    previous = ""
+    for page, text in page_texts:
+        lines = text.splitlines(keepends=True)
+        width = max((len(line.strip()) for line in lines), default=0)
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                strength = PARAGRAPH
+            elif _is_heading(stripped):
+                strength = HEADING_BREAK
+            elif not previous:
+                strength = PARAGRAPH
+            elif SENTENCE_END.search(previous):
+                strength = PARAGRAPH if len(previous) < SHORT_LINE_RATIO * width else SENTENCE
+            else:
+                strength = LINE
+            previous = stripped
+
+            if estimate_tokens(line) <= max_tokens:
+                yield strength, page, estimate_tokens(line), line
+                continue
+            # Zeilen ohne Umbruch (z.B. schlecht extrahierte Seiten) an Leerzeichen teilen
+            step = max(1, max_tokens - 1) * CHARS_PER_TOKEN
+            while line:
+                cut = len(line) if len(line) <= step else line.rfind(" ", 0, step) + 1 or step
+                yield strength, page, estimate_tokens(line[:cut]), line[:cut]
+                strength, line = LINE, line[cut:]
+
+
+def _cut(buffer, carried, target_tokens):
+    """Index after which ``buffer`` is split: the strongest boundary past MIN_FILL, the latest on ties."""
+    best, best_strength, size = len(buffer), -1, 0
+    for index, (strength, _, tokens, _) in enumerate(buffer):
+        if index > carried and size >= MIN_FILL * target_tokens and strength >= best_strength:
+            best, best_strength = index, strength
+        size += tokens
+    return best
+
+
+def plan_pieces(page_texts, target_tokens, overlap_tokens=0):
+    """Split text into pieces of at most ``target_tokens`` estimated tokens.
+
+    ``page_texts`` is an iterable of ``(page_number, text)`` pairs and is
+    consumed lazily, so a whole book can be planned without holding it in
+    memory. Pieces end before a heading once they are half full, otherwise
+    at the strongest paragraph, sentence or line boundary in their second
+    half. Each piece repeats up to ``overlap_tokens`` of whole lines from the
+    end of the previous one. Yields ``Piece(start_page, end_page, text,
+    heading)``, where ``heading`` is the heading line the piece starts with,
+    if any. The texts of a plan that fits into one piece are joined
+    unchanged; with a falsy ``target_tokens`` everything is one piece.
+    """
+    if not target_tokens:
+        pages = list(page_texts)
+        if pages:
+            yield Piece(pages[0][0], pages[-1][0], "".join(text for _, text in pages), None)
+        return
+
+    # Die Überlappung darf ein Stück nie allein füllen
+    overlap_tokens = min(overlap_tokens, int(target_tokens * MIN_FILL) - 1)
+    buffer, size, carried = [], 0, 0
+
+    def emit(count):
+        units = buffer[:count]
+        first = next((unit for unit in units[carried:] if unit[3].strip()), units[carried])
+        heading = first[3].strip() if first[0] == HEADING_BREAK else None
+        return Piece(units[0][1], units[-1][1], "".join(unit[3] for unit in units), heading)
+
+    def overlap(units):
+        tail, tokens = [], 0
+        for unit in reversed(units):
+            if tokens + unit[2] > overlap_tokens:
+                break
+            tail.insert(0, unit)
+            tokens += unit[2]
+        return tail
+
+    for unit in _units(page_texts, target_tokens):
+        strength, _, tokens, _ = unit
+        while len(buffer) > carried:
+            early_heading = strength == HEADING_BREAK and size >= MIN_FILL * target_tokens
+            if not early_heading and size + tokens <= target_tokens:
+                break
+            count = len(buffer) if early_heading else _cut(buffer, carried, target_tokens)
+            yield emit(count)
+            rest = buffer[count:]
+            # Vor einer Überschrift beginnt das nächste Stück ohne Überlappung
+            buffer = overlap(buffer[:count]) if overlap_tokens > 0 and not early_heading else []
+            carried = len(buffer)
+            buffer += rest
+            size = sum(unit[2] for unit in buffer)
+            if size + tokens > target_tokens:
+                # Die Überlappung passt nicht mehr neben den Rest und die nächste Zeile
+                buffer, carried = rest, 0
+                size = sum(unit[2] for unit in buffer)
+        buffer.append(unit)
+        size += tokens
+    if len(buffer) > carried:
+        yield emit(len(buffer))
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,5 +22,57 @@ def get_config():
         "overwrite_existing": os.getenv("OVERWRITE_EXISTING"),
         "key_vault_name": os.getenv("KEY_VAULT_NAME"),
         "key_secret_name": os.getenv("KEY_SECRET_NAME"),
-        "endpoint_secret_name": os.getenv("ENDPOINT_SECRET_NAME")
+        "endpoint_secret_name": os.getenv("ENDPOINT_SECRET_NAME"),
+        "llm_concurrency": int(os.getenv("LLM_CONCURRENCY", "5")),
+        "llm_rpm_limit": int(os.getenv("LLM_RPM_LIMIT", "500")),
+        "llm_tpm_limit": int(os.getenv("LLM_TPM_LIMIT", "200000")),
+        "llm_max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+        "llm_max_retries": int(os.getenv("LLM_MAX_RETRIES", "6")),
+        "llm_timeout_seconds": float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+        "llm_deadline_seconds": float(os.getenv("LLM_DEADLINE_SECONDS", "180")),
+        "llm_hedging": os.getenv("LLM_HEDGING", "true").lower() == "true",
+        "llm_breaker_failures": int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        "llm_breaker_reset_seconds": float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+        "outline_min_chapters": int(os.getenv("OUTLINE_MIN_CHAPTERS", "3")),
+        "outline_target_chapters": int(os.getenv("OUTLINE_TARGET_CHAPTERS", "15")),
+        "outline_max_chapters": int(os.getenv("OUTLINE_MAX_CHAPTERS", "40")),
+        "toc_score_reject": float(os.getenv("TOC_SCORE_REJECT", "0.25")),
+        "toc_score_accept": float(os.getenv("TOC_SCORE_ACCEPT", "0.7")),
+        "llm_cache_enabled": os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true",
+        "llm_cache_path": os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "pdfchun_llm_cache.sqlite3")),
+        "llm_cache_max_mb": int(os.getenv("LLM_CACHE_MAX_MB", "256")),
+        "llm_cache_ttl_seconds": int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+        "extract_workers": int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1))),
+        "parallel_extract_min_pages": int(os.getenv("PARALLEL_EXTRACT_MIN_PAGES", "300")),
+        "blob_download_concurrency": int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4")),
+        "local_classifier_threshold": float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.6")),
+        "local_classifier_use_chunks": os.getenv("LOCAL_CLASSIFIER_USE_CHUNKS", "true").lower() == "true",
+        "local_classifier_max_chunks": int(os.getenv("LOCAL_CLASSIFIER_MAX_CHUNKS", "2000")),
+        "topic_shortlist_k": int(os.getenv("TOPIC_SHORTLIST_K", "50")),
+        "chunk_target_tokens": int(os.getenv("CHUNK_TARGET_TOKENS", "1200")),
+        "chunk_overlap_tokens": int(os.getenv("CHUNK_OVERLAP_TOKENS", "100")),
+        "relevance_irrelevant_ratio": float(os.getenv("RELEVANCE_IRRELEVANT_RATIO", "0.6")),
+        "llm_batch_mode": os.getenv("LLM_BATCH_MODE", "false").lower() == "true",
+        "llm_batch_token_budget": int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "6000")),
+        "job_worker_concurrency": int(os.getenv("JOB_WORKER_CONCURRENCY", "2")),
+        "job_worker_max_seconds": int(os.getenv("JOB_WORKER_MAX_SECONDS", "240")),
+        "function_timeout_seconds": float(os.getenv("FUNCTION_TIMEOUT_SECONDS", "300")),
+        "job_deadline_margin_seconds": float(os.getenv("JOB_DEADLINE_MARGIN_SECONDS", "30")),
+        "job_lease_seconds": int(os.getenv("JOB_LEASE_SECONDS", "120")),
+        "job_heartbeat_seconds": int(os.getenv("JOB_HEARTBEAT_SECONDS", "15")),
+        "job_max_attempts": int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        "job_retry_delay_seconds": int(os.getenv("JOB_RETRY_DELAY_SECONDS", "60")),
+        "incremental_rechunking": os.getenv("INCREMENTAL_RECHUNKING", "true").lower() == "true",
+        "db_pool_min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        "db_pool_max_size": int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+        "db_statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+        "db_max_inactive_connection_lifetime": float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300")),
+        "db_health_check_seconds": float(os.getenv("DB_HEALTH_CHECK_SECONDS", "30")),
+        "topic_catalog_ttl_seconds": float(os.getenv("TOPIC_CATALOG_TTL_SECONDS", "600")),
+        "topic_catalog_listen": os.getenv("TOPIC_CATALOG_LISTEN", "true").lower() == "true",
+        "telemetry_enabled": os.getenv("TELEMETRY_ENABLED", "true").lower() == "true",
+        "streaming_mode": os.getenv("STREAMING_MODE", "auto").lower(),
+        "streaming_min_pages": int(os.getenv("STREAMING_MIN_PAGES", "800")),
+        "memory_budget_mb": int(os.getenv("MEMORY_BUDGET_MB", "4")),
+        "memory_profiling": os.getenv("MEMORY_PROFILING", "false").lower() == "true"
     }
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from telemetry import telemetry
+
+logger = logging.getLogger('PDFLogger')
+
+
+class DatabasePool:
+    """Process-wide asyncpg pool that outlives single function invocations.
+
+    The pool is created lazily on first use and kept for the lifetime of the
+    worker process. A ``SELECT 1`` health check runs at most every
+    ``health_check_seconds``; when it fails, all connections are replaced, and
+    a pool that cannot be used any more is recreated. The pool is bound to the
+    event loop it was created on and is rebuilt if it is used from another one.
+
+    Offers ``acquire`` and the ``execute``/``fetch``/``fetchrow``/``fetchval``
+    shortcuts of ``asyncpg.Pool``, and records acquire wait times for
+    ``metrics``.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=20, connect_timeout=500.0, statement_cache_size=100,
+                 max_inactive_connection_lifetime=300.0, health_check_seconds=30.0):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.statement_cache_size = statement_cache_size
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
+        self.health_check_seconds = health_check_seconds
+        self._pool = None
+        self._loop = None
+        self._lock = None
+        self._last_health_check = 0.0
+        self.created = 0
+        self.acquires = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.health_check_failures = 0
+
+    async def _create(self):
+        started = time.perf_counter()
+        self._pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=self.connect_timeout,
+            statement_cache_size=self.statement_cache_size,
+            max_inactive_connection_lifetime=self.max_inactive_connection_lifetime
+        )
+        self._last_health_check = time.monotonic()
+        self.created += 1
+        logger.info(f"Database connection pool created in {time.perf_counter() - started:.3f} seconds.")
+
+    async def _health_check(self):
+        try:
+            await asyncio.wait_for(self._pool.fetchval("SELECT 1"), timeout=self.connect_timeout)
+        except Exception as e:
+            self.health_check_failures += 1
+            logger.warning(f"Database health check failed, replacing connections: {str(e)}")
+            await self._pool.expire_connections()
+            try:
+                await asyncio.wait_for(self._pool.fetchval("SELECT 1"), timeout=self.connect_timeout)
+            except Exception:
+                logger.warning("Database pool is unusable, recreating it.")
+                self._pool.terminate()
+                await self._create()
+        self._last_health_check = time.monotonic()
+
+    async def get(self):
+        """Return the asyncpg pool, creating or repairing it if necessary."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._pool is not None:
+                logger.info("Event loop changed, discarding the database pool.")
+                self.terminate()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is None or self._pool.is_closing():
+                await self._create()
+            elif time.monotonic() - self._last_health_check > self.health_check_seconds:
+                await self._health_check()
+        return self._pool
+
+    def mark_unhealthy(self):
+        """Force a health check before the next connection is handed out."""
+        self._last_health_check = 0.0
+
+    @asynccontextmanager
+    async def acquire(self):
+        pool = await self.get()
+        started = time.perf_counter()
+        async with pool.acquire() as connection:
+            waited = time.perf_counter() - started
+            self.acquires += 1
+            self.acquire_wait_total += waited
+            self.acquire_wait_max = max(self.acquire_wait_max, waited)
+            telemetry.observe("db_acquire", waited)
+            yield connection
+
+    async def execute(self, query, *args):
+        async with self.acquire() as connection:
+            with telemetry.span("db_query"):
+                return await connection.execute(query, *args)
+
+    async def fetch(self, query, *args):
+        async with self.acquire() as connection:
+            with telemetry.span("db_query"):
+                return await connection.fetch(query, *args)
+
+    async def fetchrow(self, query, *args):
+        async with self.acquire() as connection:
+            with telemetry.span("db_query"):
+                return await connection.fetchrow(query, *args)
+
+    async def fetchval(self, query, *args):
+        async with self.acquire() as connection:
+            with telemetry.span("db_query"):
+                return await connection.fetchval(query, *args)
+
+    def metrics(self):
+        pool = self._pool
+        size = pool.get_size() if pool is not None else 0
+        idle = pool.get_idle_size() if pool is not None else 0
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "max_size": self.max_size,
+            "pools_created": self.created,
+            "acquires": self.acquires,
+            "acquire_wait_avg_ms": round(1000 * self.acquire_wait_total / self.acquires, 3) if self.acquires else 0.0,
+            "acquire_wait_max_ms": round(1000 * self.acquire_wait_max, 3),
+            "health_check_failures": self.health_check_failures,
+        }
+
+    async def close(self, timeout=10.0):
+        """Close the pool gracefully, terminating connections still busy after ``timeout``."""
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        try:
+            await asyncio.wait_for(pool.close(), timeout=timeout)
+        except (asyncio.TimeoutError, RuntimeError):
+            pool.terminate()
+        logger.info("Database connection pool closed.")
+
+    def terminate(self):
+        """Synchronous shutdown for interpreter exit, when no event loop is running."""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            try:
+                pool.terminate()
+            except RuntimeError:
+                # Die Event-Loop des Pools ist bereits geschlossen
+                pass
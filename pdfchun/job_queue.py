@@ -0,0 +1,191 @@
+import json
+import logging
+import uuid
+
+logger = logging.getLogger('PDFLogger')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunking_job (
+    job_id UUID PRIMARY KEY,
+    book_id INTEGER NOT NULL,
+    replace_existing BOOLEAN NOT NULL DEFAULT FALSE,
+    force_rebuild BOOLEAN NOT NULL DEFAULT FALSE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    steps JSONB NOT NULL DEFAULT '[]'::jsonb,
+    metrics JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    heartbeat_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+CREATE UNIQUE INDEX IF NOT EXISTS chunking_job_active_book ON chunking_job (book_id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS chunking_job_claim ON chunking_job (status, run_after, created_at);
+"""
+# Spalten, die nach der ersten Version der Tabelle hinzugekommen sind
+ADDED_COLUMNS = {
+    "force_rebuild": "BOOLEAN NOT NULL DEFAULT FALSE",
+    "metrics": "JSONB",
+}
+
+schema_ready = False
+
+
+async def ensure_job_schema(pool):
+    """Create the job table and its indexes if they do not exist yet.
+
+    Runs once per process: ALTER TABLE takes an ACCESS EXCLUSIVE lock on the
+    queue, which would compete with every claim if it ran on each request.
+    """
+    global schema_ready
+    if schema_ready:
+        return
+    await pool.execute(SCHEMA)
+    existing = {
+        row["column_name"] for row in await pool.fetch(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'chunking_job'"
+        )
+    }
+    for column, definition in ADDED_COLUMNS.items():
+        if column not in existing:
+            await pool.execute(f"ALTER TABLE chunking_job ADD COLUMN IF NOT EXISTS {column} {definition}")
+            logger.info(f"Added {column} column to the chunking_job table.")
+    schema_ready = True
+
+
+async def enqueue_job(pool, book_id, replace_existing=False, force_rebuild=False):
+    """Queue a chunking job for ``book_id`` and return ``(job_id, created)``.
+
+    A book has at most one queued or running job; enqueueing it again returns
+    the active job instead of creating a second one. ``force_rebuild`` makes
+    the worker ignore checkpoints of earlier runs.
+    """
+    job_id = await pool.fetchval(
+        """
+        INSERT INTO chunking_job (job_id, book_id, replace_existing, force_rebuild)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (book_id) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING job_id
+        """,
+        uuid.uuid4(), book_id, replace_existing, force_rebuild
+    )
+    if job_id is not None:
+        logger.info(f"Queued chunking job {job_id} for book_id {book_id}")
+        return str(job_id), True
+
+    job_id = await pool.fetchval(
+        "SELECT job_id FROM chunking_job WHERE book_id = $1 AND status IN ('queued', 'running')",
+        book_id
+    )
+    logger.info(f"Chunking job {job_id} for book_id {book_id} is already active")
+    return str(job_id), False
+
+
+async def claim_job(pool, worker_id, lease_seconds, max_attempts):
+    """Claim the oldest runnable job with ``FOR UPDATE SKIP LOCKED``.
+
+    Runnable are queued jobs whose ``run_after`` has passed and running jobs
+    whose worker stopped sending heartbeats for ``lease_seconds``. Concurrent
+    workers never claim the same row. Returns the job as a dict or None.
+    """
+    await pool.execute(
+        """
+        UPDATE chunking_job
+        SET status = 'failed', error = 'Lease expired after the last attempt', finished_at = now()
+        WHERE status = 'running' AND attempts >= $2
+          AND heartbeat_at < now() - make_interval(secs => $1)
+        """,
+        float(lease_seconds), max_attempts
+    )
+    row = await pool.fetchrow(
+        """
+        UPDATE chunking_job
+        SET status = 'running', worker_id = $1, attempts = attempts + 1,
+            started_at = coalesce(started_at, now()), heartbeat_at = now()
+        WHERE job_id = (
+            SELECT job_id FROM chunking_job
+            WHERE (status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND attempts < $3
+                   AND heartbeat_at < now() - make_interval(secs => $2))
+            ORDER BY created_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING job_id, book_id, replace_existing, force_rebuild, attempts
+        """,
+        worker_id, float(lease_seconds), max_attempts
+    )
+    if row is None:
+        return None
+    job = dict(row)
+    job["job_id"] = str(job["job_id"])
+    logger.info(f"Worker {worker_id} claimed job {job['job_id']} for book_id {job['book_id']} (attempt {job['attempts']})")
+    return job
+
+
+async def heartbeat(pool, job_id, worker_id, steps):
+    """Extend the lease and publish the progress ``steps``.
+
+    Returns False if another worker has taken the job over in the meantime.
+    """
+    result = await pool.execute(
+        """
+        UPDATE chunking_job SET heartbeat_at = now(), steps = $3::jsonb
+        WHERE job_id = $1 AND worker_id = $2 AND status = 'running'
+        """,
+        uuid.UUID(job_id), worker_id, json.dumps(steps, ensure_ascii=False)
+    )
+    return result != "UPDATE 0"
+
+
+async def complete_job(pool, job_id, worker_id, steps, metrics=None):
+    await pool.execute(
+        """
+        UPDATE chunking_job SET status = 'completed', steps = $3::jsonb, metrics = $4::jsonb, error = NULL, finished_at = now()
+        WHERE job_id = $1 AND worker_id = $2
+        """,
+        uuid.UUID(job_id), worker_id, json.dumps(steps, ensure_ascii=False), json.dumps(metrics)
+    )
+
+
+async def fail_job(pool, job_id, worker_id, steps, error, retry_delay_seconds=None, metrics=None):
+    """Record a failed attempt; requeue after ``retry_delay_seconds`` or fail for good."""
+    status = "failed" if retry_delay_seconds is None else "queued"
+    await pool.execute(
+        """
+        UPDATE chunking_job
+        SET status = $3, steps = $4::jsonb, error = $6, metrics = $7::jsonb,
+            run_after = CASE WHEN $3 = 'queued' THEN now() + make_interval(secs => $5) ELSE run_after END,
+            finished_at = CASE WHEN $3 = 'failed' THEN now() END
+        WHERE job_id = $1 AND worker_id = $2
+        """,
+        uuid.UUID(job_id), worker_id, status, json.dumps(steps, ensure_ascii=False), float(retry_delay_seconds or 0), error,
+        json.dumps(metrics)
+    )
+
+
+async def get_job(pool, job_id):
+    """Return the public view of a job, or None if ``job_id`` is unknown."""
+    try:
+        job_uuid = uuid.UUID(str(job_id))
+    except ValueError:
+        return None
+    row = await pool.fetchrow(
+        """
+        SELECT job_id, book_id, status, steps, metrics, error, attempts, created_at, started_at, heartbeat_at, finished_at
+        FROM chunking_job WHERE job_id = $1
+        """,
+        job_uuid
+    )
+    if row is None:
+        return None
+    job = dict(row)
+    job["job_id"] = str(job["job_id"])
+    job["steps"] = json.loads(job["steps"])
+    job["metrics"] = json.loads(job["metrics"]) if job["metrics"] else None
+    for column in ("created_at", "started_at", "heartbeat_at", "finished_at"):
+        job[column] = job[column].isoformat() if job[column] else None
+    return job
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('PDFLogger')
+
+
+class LLMCache:
+    """Persistent cache for structured LLM responses backed by SQLite.
+
+    Entries are keyed on a hash of model, messages and response schema. The
+    cache is bounded by ``max_bytes`` with least-recently-used eviction and
+    entries older than ``ttl_seconds`` are treated as misses. The total size
+    is tracked in memory, so a ``put`` only scans the table once it has to
+    evict.
+    """
+
+    def __init__(self, path, max_bytes, ttl_seconds):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_response (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_last_access ON llm_response (last_access)")
+        self._total = self._stored_size()
+        logger.info(f"LLM response cache opened at {path}")
+
+    @staticmethod
+    def make_key(model, messages, response_format):
+        payload = json.dumps({
+            "model": model,
+            "messages": messages,
+            "schema": response_format.model_json_schema(),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at, size FROM llm_response WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._delete(key, row[2])
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_response SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM llm_response WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._total += size - (replaced[0] if replaced else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _stored_size(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_response").fetchone()[0]
+
+    def _delete(self, key, size):
+        self._conn.execute("DELETE FROM llm_response WHERE key = ?", (key,))
+        self._total -= size
+
+    def _evict(self):
+        # Andere Worker-Prozesse schreiben in dieselbe Datei, daher vor dem Löschen neu zählen
+        self._total = self._stored_size()
+        if self._total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM llm_response ORDER BY last_access").fetchall():
+            self._delete(key, size)
+            self.evictions += 1
+            if self._total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_response").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
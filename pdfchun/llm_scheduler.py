@@ -0,0 +1,400 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+from telemetry import telemetry
+
+logger = logging.getLogger('PDFLogger')
+
+# Kleinere Werte werden zuerst bedient
+PRIORITY_HIGH = 0
+PRIORITY_BULK = 1
+
+TRANSIENT_ERRORS = (APIConnectionError, InternalServerError, asyncio.TimeoutError)
+
+HEDGE_MIN_SAMPLES = 20
+# Höchstens so viele zusätzliche Anfragen durch Hedging
+HEDGE_MAX_RATIO = 0.1
+
+
+class CircuitOpenError(Exception):
+    """The provider is considered degraded; callers should use their fallback."""
+
+
+class CircuitBreaker:
+    """Stops LLM requests after ``failure_threshold`` consecutive failures.
+
+    Timeouts, connection errors and server errors count as failures, 429s
+    do not. While open, requests fail immediately; after ``reset_seconds`` a
+    single probe request is let through and closes the breaker on success.
+    A threshold of 0 disables the breaker.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("OpenAI requests succeed again, closing the circuit breaker.")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failure_threshold > 0 and (self.state == "half_open" or self.failures >= self.failure_threshold):
+            if self.state != "open":
+                self.opened += 1
+                logger.warning(f"OpenAI degraded after {self.failures} failures, opening the circuit breaker for {self.reset_seconds:.0f}s.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class LatencyWindow:
+    """The latest successful request durations of one request kind."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def p95(self):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95)]
+
+
+class TokenBucket:
+    """Budget of ``per_minute`` units refilled continuously.
+
+    The bucket holds at most ``burst_seconds`` worth of budget, so an idle
+    worker cannot fire a whole minute of requests at once. A single request
+    larger than the bucket is admitted once the bucket is full.
+    """
+
+    def __init__(self, per_minute, burst_seconds=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` can be taken, 0 if it is available now."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, now):
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+
+def retry_after_seconds(error):
+    """Read ``retry-after-ms`` or ``retry-after`` from a 429 response, None if absent."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class LLMScheduler:
+    """Process-wide admission control for OpenAI requests.
+
+    Every request waits until the requests-per-minute and tokens-per-minute
+    buckets can pay for it and fewer than ``limit`` requests are in flight.
+    Waiting requests are served by priority, then in arrival order, so TOC
+    detection overtakes queued bulk classification. The token cost is an
+    estimate; the bucket is corrected with the reported usage afterwards.
+
+    ``limit`` adapts like TCP congestion control: it grows by one after
+    ``limit`` successful requests and halves on a 429, which also empties the
+    buckets and pauses all dispatch for the ``Retry-After`` time. Rate-limited
+    and transient requests are retried up to ``max_retries`` times; an
+    exhausted quota (``insufficient_quota``) is raised immediately.
+
+    Each attempt is cancelled after ``timeout`` seconds and no retry is
+    started once ``deadline`` seconds have passed since the call began; a
+    request still queued at the deadline fails with a timeout. With
+    ``hedging``, a request still running the p95 latency of its kind after
+    it left the queue is sent a second time and the first answer wins. Hedges are skipped
+    while rate limited and capped at ``HEDGE_MAX_RATIO`` of all requests.
+    ``breaker`` rejects calls with ``CircuitOpenError`` while the provider is
+    degraded.
+    """
+
+    def __init__(self, rpm_limit, tpm_limit, max_concurrency, max_retries=6, burst_seconds=10.0,
+                 timeout=60.0, deadline=180.0, hedging=True, breaker=None):
+        self.requests = TokenBucket(rpm_limit, burst_seconds)
+        self.tokens = TokenBucket(tpm_limit, burst_seconds)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.hedging = hedging
+        self.breaker = breaker or CircuitBreaker(0, 0)
+        self.latencies = {}
+        self.in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self._loop = None
+        self.throttled = 0
+        self.retries = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Warteschlange und Timer gehören zur vorherigen Event-Loop
+            self._loop = loop
+            self._waiters = []
+            self._timer = None
+            self.in_flight = 0
+        return loop
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            _, _, cost, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= self.limit:
+                return
+            delay = max(self._paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(cost, now))
+            if delay > 0:
+                self._timer = self._loop.call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1, now)
+            self.tokens.take(cost, now)
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def _acquire(self, cost, priority, timeout=None):
+        loop = self._bind_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), cost, future))
+        self._dispatch()
+        try:
+            # Ein abgelaufener Wartender wird storniert und von _dispatch übersprungen
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _on_success(self, cost, used):
+        self.completed += 1
+        if used is not None:
+            # Schätzung durch den tatsächlichen Verbrauch ersetzen
+            self.tokens.give_back(cost - used)
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_concurrency:
+            self.limit += 1
+            self._successes = 0
+
+    def _on_rate_limited(self, delay):
+        now = time.monotonic()
+        self.throttled += 1
+        telemetry.count("llm_throttled")
+        if now >= self._paused_until:
+            # Nur der erste 429 einer Welle halbiert das Limit
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            logger.warning(f"OpenAI rate limit hit, pausing {delay:.1f}s with concurrency {self.limit}.")
+        self._paused_until = max(self._paused_until, now + delay)
+        self.requests.drain(now)
+        self.tokens.drain(now)
+
+    async def _attempt(self, request, tokens, priority, timeout, kind, until, budget_capped, dispatched=None):
+        queued = time.perf_counter()
+        await self._acquire(tokens, priority, max(0.0, until - time.monotonic()))
+        telemetry.observe("llm_queue", time.perf_counter() - queued)
+        if dispatched is not None:
+            dispatched.set()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(request(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            telemetry.count("llm_timeouts")
+            if not budget_capped:
+                # Ein vom Job-Budget verkürztes Timeout sagt nichts über OpenAI aus
+                self.breaker.record_failure()
+            raise
+        except TRANSIENT_ERRORS:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self._release()
+        self.breaker.record_success()
+        if kind is not None:
+            self.latencies.setdefault(kind, LatencyWindow()).add(time.perf_counter() - started)
+        usage = getattr(result, "usage", None)
+        used = usage.prompt_tokens + usage.completion_tokens if usage is not None else None
+        self._on_success(tokens, used)
+        return result
+
+    def _hedge_delay(self, kind):
+        if not self.hedging or kind not in self.latencies:
+            return None
+        if time.monotonic() < self._paused_until or self.hedges_issued >= HEDGE_MAX_RATIO * self.completed:
+            return None
+        return self.latencies[kind].p95()
+
+    async def _hedged(self, request, tokens, priority, timeout, kind, until, budget_capped):
+        if not self.hedging or kind is None:
+            return await self._attempt(request, tokens, priority, timeout, kind, until, budget_capped)
+
+        dispatched = asyncio.Event()
+        primary = asyncio.ensure_future(self._attempt(request, tokens, priority, timeout, kind, until, budget_capped, dispatched))
+        tasks = {primary}
+        try:
+            # Die Zeit in der Warteschlange ist keine langsame Antwort, der Timer läuft erst ab dem Versand
+            waiter = asyncio.ensure_future(dispatched.wait())
+            try:
+                await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            # Erst jetzt lesen, damit auch ein Burst gleichzeitiger Aufrufe die inzwischen gesammelten Latenzen nutzt
+            delay = self._hedge_delay(kind) if not primary.done() else None
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._hedge_delay(kind) is not None:
+                    self.hedges_issued += 1
+                    telemetry.count("llm_hedges", kind="issued")
+                    tasks.add(asyncio.ensure_future(self._attempt(request, tokens, priority, timeout - delay, kind, until, budget_capped)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedges_won += 1
+                            telemetry.count("llm_hedges", kind="won")
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, request, tokens, priority=PRIORITY_BULK, kind=None, timeout=None, deadline=None, budget_capped=False):
+        """Await ``request()`` within the budgets and return its result.
+
+        ``tokens`` is the estimated prompt plus completion size. If the result
+        has a ``usage`` with prompt and completion tokens, the tokens bucket
+        is settled with the actual numbers. ``kind`` names the request type
+        whose latencies decide when to hedge; without it no hedge is sent.
+        ``timeout`` and ``deadline`` override the scheduler's defaults. With
+        ``budget_capped``, ``timeout`` was shortened by the caller's time
+        budget and its expiry does not count against the circuit breaker.
+        """
+        timeout = timeout or self.timeout
+        deadline = deadline or self.deadline
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                telemetry.count("llm_circuit_rejected")
+                raise CircuitOpenError("OpenAI circuit breaker is open")
+            probe = self.breaker.state == "half_open"
+            try:
+                return await self._hedged(request, tokens, priority, timeout, kind, started + deadline, budget_capped)
+            except RateLimitError as e:
+                if e.code == "insufficient_quota" or attempt == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                self._on_rate_limited(delay)
+            except TRANSIENT_ERRORS as e:
+                delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                if attempt == self.max_retries or time.monotonic() + delay - started >= deadline:
+                    raise
+                logger.warning(f"Transient OpenAI error, retrying in {delay:.1f}s: {str(e) or type(e).__name__}")
+                await asyncio.sleep(delay)
+            finally:
+                if probe:
+                    # Eine Probe ohne Urteil (429, Abbruch) gibt den Platz frei
+                    self.breaker.probing = False
+            if time.monotonic() - started >= deadline:
+                raise asyncio.TimeoutError(f"No OpenAI answer within the {deadline:.0f}s deadline")
+            self.retries += 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": sum(1 for *_, future in self._waiters if not future.done()),
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges_issued": self.hedges_issued,
+            "hedges_won": self.hedges_won,
+            "circuit": self.breaker.state,
+        }
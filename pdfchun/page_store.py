@@ -0,0 +1,58 @@
+import threading
+import time
+
+from telemetry import telemetry
+
+# MuPDF ist nicht threadsicher, auch nicht über Dokumente hinweg; Seiten werden aber in Worker-Threads gelesen
+MUPDF_LOCK = threading.Lock()
+
+
+def clean_page_text(text):
+    """Remove null bytes and replace characters that cannot be encoded as UTF-8."""
+    text = text.replace('\x00', '')  # Entferne Null-Bytes
+    return text.encode('utf-8', 'replace').decode('utf-8')  # Ersetze ungültige Zeichen mit '?'
+
+
+class PageTextStore:
+    """Per-document cache of cleaned page texts.
+
+    Every page is extracted with ``get_text()`` and cleaned at most once, no
+    matter how many TOC probes, chapters or chunks read it afterwards. Without
+    ``cache`` pages are extracted on every read and nothing is kept, which
+    bounds memory for very large books at the cost of repeated extraction.
+    Pages may be read from worker threads; MuPDF calls hold ``MUPDF_LOCK``.
+    """
+
+    def __init__(self, document, cache=True):
+        self.document = document
+        self.cache = cache
+        self._pages = [None] * len(document)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def page(self, page_num):
+        text = self._pages[page_num]
+        if text is None:
+            started = time.perf_counter()
+            with MUPDF_LOCK:
+                raw = self.document[page_num].get_text()
+            text = clean_page_text(raw)
+            if self.cache:
+                self._pages[page_num] = text
+            telemetry.observe("page_text", time.perf_counter() - started)
+        return text
+
+    def text(self, start, end):
+        """Return pages ``start`` to ``end`` (exclusive), each followed by a newline."""
+        return "".join(self.page(page_num) + "\n" for page_num in range(start, end))
+
+    def preload(self, texts):
+        """Fill the store with already cleaned page texts, e.g. from parallel extraction."""
+        if len(texts) != len(self._pages):
+            raise ValueError(f"Expected {len(self._pages)} pages, got {len(texts)}.")
+        self._pages = list(texts)
+
+    def texts(self, start, end):
+        """Return the texts of pages ``start`` to ``end`` (exclusive) as a list."""
+        return [self.page(page_num) for page_num in range(start, end)]
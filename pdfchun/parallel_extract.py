@@ -0,0 +1,39 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+from page_store import clean_page_text
+
+logger = logging.getLogger('PDFLogger')
+
+
+def _extract_range(pdf_path, start, end):
+    # Jeder Worker öffnet das Dokument selbst, PyMuPDF lädt Seiten nur bei Bedarf
+    with fitz.open(pdf_path) as document:
+        return start, [clean_page_text(document[page_num].get_text()) for page_num in range(start, end)]
+
+
+def page_batches(page_count, workers, batches_per_worker=4):
+    """Split ``range(page_count)`` into contiguous (start, end) batches."""
+    batch_count = max(1, min(page_count, workers * batches_per_worker))
+    size = -(-page_count // batch_count)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def extract_pages_parallel(pdf_path, page_count, workers):
+    """Extract the cleaned text of all pages using a pool of ``workers`` processes.
+
+    Pages are split into contiguous batches that are spread over the workers;
+    the returned list is in page order.
+    """
+    pages = [None] * page_count
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(_extract_range, pdf_path, start, end) for start, end in page_batches(page_count, workers)]
+        for future in futures:
+            start, texts = future.result()
+            pages[start:start + len(texts)] = texts
+    logger.info(f"Extracted {page_count} pages with {workers} worker processes.")
+    return pages
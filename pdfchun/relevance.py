@@ -0,0 +1,135 @@
+import re
+import unicodedata
+from collections import Counter
+
+from toc_heuristics import score_toc_page
+
+# Lokale Erkennung von Seiten ohne Lerninhalt (Register, Glossar, Literatur, Inhaltsverzeichnis, Titelei)
+
+HEADING_KEYWORDS = {
+    "index": re.compile(r'\b(index|register|stichwortverzeichnis|sachverzeichnis|sachregister|schlagwortverzeichnis)\b', re.IGNORECASE),
+    "glossary": re.compile(r'\b(glossar|glossary|begriffserklärungen|abkürzungsverzeichnis|abbreviations)\b', re.IGNORECASE),
+    "bibliography": re.compile(r'\b(literaturverzeichnis|literatur|bibliography|bibliographie|references|quellenverzeichnis|quellen)\b', re.IGNORECASE),
+}
+FRONT_MATTER = re.compile(
+    r'(isbn|©|copyright|all rights reserved|alle rechte vorbehalten|impressum|bibliografische information|'
+    r'deutsche nationalbibliothek|printed in|gedruckt auf|library of congress)',
+    re.IGNORECASE
+)
+INDEX_ENTRY = re.compile(r'[,\s]\d{1,4}(\s*[–-]\s*\d{1,4})?(\s*[,;]\s*\d{1,4}(\s*[–-]\s*\d{1,4})?)*\s*$')
+GLOSSARY_ENTRY = re.compile(r'^[\w\-äöüÄÖÜß ]{2,40}\s*[:–—-]\s+\S')
+# Formeln und Rechenaufgaben enden oft auf eine Zahl oder folgen auf "Aufgabe 1:", sind aber weder Register- noch Glossareinträge
+FORMULA = re.compile(r'[=<>≤≥−]|\d\s*[+*/×·÷^]\s*[\w(]')
+# Jahreszahlen allein kommen auch in Fließtext vor (Geschichte), daher nur eindeutige Zitiermerkmale
+CITATION = re.compile(r'(\(\d{4}[a-z]?\)|et al\.|\bpp?\.\s*\d|\bS\.\s*\d|doi|\bVerlag\b|\bPress\b|\bHrsg\.|\bEds?\.)')
+BIBLIOGRAPHY_AUTHOR = re.compile(r"^[A-ZÄÖÜ][\w'’-]+,\s+([A-ZÄÖÜ]\.|[A-ZÄÖÜ][a-zäöüß]+\s*[,;:(])")
+BIBLIOGRAPHY_PUBLISHER = re.compile(r'\b[A-ZÄÖÜ][a-zäöüß]+(/[A-ZÄÖÜ][a-zäöüß]+)?:\s*[A-ZÄÖÜ][\w&.-]*.*\b(19|20)\d{2}\b')
+BIBLIOGRAPHY_MIN_ENTRY_RATIO = 0.5
+NUMBER = re.compile(r'\d+')
+WORD = re.compile(r'[^\W\d_]+')
+
+KIND_THRESHOLD = 0.5
+TOC_THRESHOLD = 0.7
+
+
+def _fold(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def page_features(page_text):
+    """Compute the layout and vocabulary features used by classify_page."""
+    lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+    if not lines:
+        return None
+    words = WORD.findall(page_text)
+    numbers = NUMBER.findall(page_text)
+    initials = [_fold(line)[:1] for line in lines if _fold(line)[:1].isalpha()]
+    ordered = sum(1 for previous, current in zip(initials, initials[1:]) if current >= previous)
+    lengths = sorted(len(line) for line in lines)
+    head = " ".join(lines[:3])
+
+    return {
+        "line_count": len(lines),
+        "median_line_length": lengths[len(lengths) // 2],
+        "short_line_ratio": sum(1 for length in lengths if length < 45) / len(lines),
+        "number_word_ratio": len(numbers) / max(1, len(words)),
+        "alphabetical_ratio": ordered / (len(initials) - 1) if len(initials) > 2 else 0.0,
+        "index_entry_ratio": sum(
+            1 for line in lines if line[:1].isalpha() and INDEX_ENTRY.search(line) and not FORMULA.search(line)
+        ) / len(lines),
+        "glossary_entry_ratio": sum(1 for line in lines if GLOSSARY_ENTRY.match(line) and not FORMULA.search(line)) / len(lines),
+        "citation_ratio": sum(
+            1 for line in lines
+            if CITATION.search(line) or BIBLIOGRAPHY_AUTHOR.match(line) or BIBLIOGRAPHY_PUBLISHER.search(line)
+        ) / len(lines),
+        "front_matter_hits": len(FRONT_MATTER.findall(page_text)),
+        "headings": {kind: bool(pattern.search(head)) for kind, pattern in HEADING_KEYWORDS.items()},
+    }
+
+
+def classify_page(page_text):
+    """Return the kind of non-content page ('index', 'glossary', 'bibliography',
+    'toc', 'front_matter'), 'blank' for empty pages, or None for regular content."""
+    features = page_features(page_text)
+    if features is None or features["line_count"] < 2:
+        return "blank"
+
+    headings = features["headings"]
+    scores = {
+        "index": (
+            0.45 * min(1.0, features["index_entry_ratio"] / 0.5)
+            + 0.25 * features["alphabetical_ratio"]
+            + 0.15 * features["short_line_ratio"]
+            + 0.15 * headings["index"]
+        ),
+        "glossary": (
+            0.45 * min(1.0, features["glossary_entry_ratio"] / 0.5)
+            + 0.30 * features["alphabetical_ratio"]
+            + 0.25 * headings["glossary"]
+        ),
+        "bibliography": (
+            0.60 * min(1.0, features["citation_ratio"] / 0.5)
+            + 0.15 * min(1.0, features["number_word_ratio"] / 0.15)
+            + 0.25 * headings["bibliography"]
+        ),
+        "front_matter": (
+            min(1.0, features["front_matter_hits"] / 2) * (1.0 if features["line_count"] < 40 else 0.5)
+        ),
+    }
+    # Literaturverzeichnisse brauchen die Überschrift oder überwiegend Einträge mit Autor, Jahr oder Verlag
+    if not headings["bibliography"] and features["citation_ratio"] < BIBLIOGRAPHY_MIN_ENTRY_RATIO:
+        scores["bibliography"] = 0.0
+    # Register und Glossare sind alphabetisch sortiert
+    for kind in ("index", "glossary"):
+        if features["alphabetical_ratio"] < 0.6 and not headings[kind]:
+            scores[kind] *= 0.5
+    # Fließtext hat lange Zeilen, Verzeichnisse kurze (Literaturangaben ausgenommen)
+    if features["median_line_length"] > 80:
+        scores = {kind: score if kind == "bibliography" else score * 0.5 for kind, score in scores.items()}
+    if score_toc_page(page_text) >= TOC_THRESHOLD:
+        scores["toc"] = 1.0
+
+    kind, score = max(scores.items(), key=lambda item: item[1])
+    return kind if score >= KIND_THRESHOLD else None
+
+
+def detect_relevance(page_texts, irrelevant_ratio=0.6):
+    """Decide whether a chunk made of ``page_texts`` is learning content.
+
+    The chunk counts as irrelevant when at least ``irrelevant_ratio`` of its
+    non-blank pages are index, glossary, bibliography, TOC or front matter
+    pages. Returns ``{"is_relevant", "kind", "irrelevant_ratio"}`` where
+    ``kind`` is the most common non-content page kind.
+    """
+    kinds = [classify_page(text) for text in page_texts]
+    kinds = [kind for kind in kinds if kind != "blank"]
+    if not kinds:
+        return {"is_relevant": False, "kind": "blank", "irrelevant_ratio": 1.0}
+
+    irrelevant = [kind for kind in kinds if kind is not None]
+    ratio = len(irrelevant) / len(kinds)
+    return {
+        "is_relevant": ratio < irrelevant_ratio,
+        "kind": Counter(irrelevant).most_common(1)[0][0] if irrelevant else None,
+        "irrelevant_ratio": round(ratio, 2),
+    }
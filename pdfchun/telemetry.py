@@ -0,0 +1,222 @@
+import os
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+import psutil
+
+PREFIX = "pdfchun"
+
+# Sekundengrenzen von schnellen DB-Abfragen bis zu langen LLM-Aufrufen
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_process = psutil.Process(os.getpid())
+_current_trace = ContextVar("pdfchun_trace", default=None)
+_NOOP = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Trace:
+    """Per-job aggregation of spans and counters.
+
+    Spans of the same name and labels are summed up, so a trace stays small
+    even when a book makes hundreds of LLM calls or queries. Label values are
+    appended to the name, e.g. ``llm_call.ClassificationResult``.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+        self.memory = {}
+        self.stages = []
+
+    def record(self, name, seconds):
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def add(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_memory(self, name, heap_peak, rss):
+        entry = self.memory.setdefault(name, {"rss_mb": 0.0})
+        entry["rss_mb"] = max(entry["rss_mb"], round(rss / 1024 / 1024, 1))
+        if heap_peak is not None:
+            entry["heap_peak_mb"] = max(entry.get("heap_peak_mb", 0.0), round(heap_peak / 1024 / 1024, 1))
+
+    def summary(self):
+        summary = {
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+            "spans": {
+                name: {"count": count, "total_seconds": round(total, 3), "max_seconds": round(longest, 3)}
+                for name, (count, total, longest) in sorted(self.spans.items(), key=lambda item: -item[1][1])
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if self.memory:
+            summary["memory"] = self.memory
+        return summary
+
+
+class Telemetry:
+    """Lightweight span timing and counters for the chunking pipeline.
+
+    ``span`` times a block and records it in a process-wide histogram per span
+    name and label set, and in the trace of the current job (see ``trace``).
+    ``count`` adds to a counter in both places. Traces are found through a
+    context variable, so tasks started by ``asyncio.gather`` report to the job
+    that started them. ``prometheus`` renders everything recorded by this
+    process in the Prometheus text format.
+
+    ``stage`` is a span for the sequential steps of a job that also records
+    the process RSS at its end and, while ``tracemalloc`` is tracing, the peak
+    Python heap during the stage. Stages may nest but must not overlap.
+
+    When disabled, ``span`` and ``stage`` return a shared no-op context
+    manager and ``count`` returns immediately. Setting ``samples`` to a dict
+    additionally keeps every single duration by trace key, for percentiles
+    in benchmarks.
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.histograms = {}
+        self.counters = {}
+        self.samples = None
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return _NOOP
+        return self._span(name, labels)
+
+    @contextmanager
+    def _span(self, name, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NOOP
+        return self._stage(name)
+
+    @contextmanager
+    def _stage(self, name):
+        trace = _current_trace.get()
+        tracing = tracemalloc.is_tracing()
+        frame = [name, 0]
+        if tracing:
+            # Der bisherige Spitzenwert gehört noch zur umgebenden Stufe
+            if trace is not None and trace.stages:
+                trace.stages[-1][1] = max(trace.stages[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if trace is not None:
+            trace.stages.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+            if trace is not None:
+                trace.stages.pop()
+                heap_peak = max(frame[1], tracemalloc.get_traced_memory()[1]) if tracing else None
+                trace.record_memory(name, heap_peak, _process.memory_info().rss)
+
+    def observe(self, name, seconds, **labels):
+        """Record a duration measured elsewhere as if it had been a span."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        if self.samples is not None:
+            self.samples.setdefault(_trace_key(key), []).append(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record(_trace_key(key), seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(_trace_key(key), value)
+
+    @contextmanager
+    def trace(self):
+        """Collect the spans and counters of the enclosed block into a new Trace."""
+        trace = Trace()
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+    def prometheus(self):
+        lines = [
+            f"# HELP {PREFIX}_span_duration_seconds Duration of pipeline stages, LLM calls and database round trips.",
+            f"# TYPE {PREFIX}_span_duration_seconds histogram",
+        ]
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            base = (("span", name),) + labels
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{PREFIX}_span_duration_seconds_bucket{_labels(base + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}_span_duration_seconds_sum{_labels(base)} {histogram.sum:.6f}")
+            lines.append(f"{PREFIX}_span_duration_seconds_count{_labels(base)} {histogram.count}")
+
+        families = {}
+        for (name, labels), value in self.counters.items():
+            families.setdefault(name, []).append((labels, value))
+        for name in sorted(families):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for labels, value in sorted(families[name]):
+                lines.append(f"{PREFIX}_{name}_total{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _trace_key(key):
+    # Label-Werte werden an den Namen gehängt, z.B. "llm_tokens.prompt"
+    name, labels = key
+    return ".".join((name,) + tuple(str(value) for _, value in labels))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+telemetry = Telemetry()
@@ -0,0 +1,67 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger('PDFLogger')
+
+# Share des Budgets, unter der die jeweilige LLM-Stufe durch eine lokale ersetzt wird
+DEGRADATION_THRESHOLDS = {
+    "toc_probing": 0.5,
+    "llm_titles": 0.35,
+    "llm_classification": 0.2,
+}
+
+_current_budget = ContextVar("pdfchun_time_budget", default=None)
+
+
+class TimeBudget:
+    """Wall-clock budget of one job with staged degradation.
+
+    ``allows(step)`` is asked before every optional LLM step. Once less than
+    the step's share in ``DEGRADATION_THRESHOLDS`` of ``scale`` seconds is
+    left, it answers False for the rest of the job and records the step in
+    ``degradations``, so the remaining work falls back to local strategies
+    and the book is stored before the host stops the function. ``scale``
+    defaults to ``seconds``; a job started late in a worker invocation
+    passes the full invocation budget and begins degraded.
+    """
+
+    def __init__(self, seconds, scale=None):
+        self.seconds = max(0.0, seconds)
+        self.scale = scale or self.seconds
+        self.deadline = time.monotonic() + self.seconds
+        self.degradations = []
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def allows(self, step):
+        if step in self.degradations:
+            return False
+        if self.remaining() >= DEGRADATION_THRESHOLDS[step] * self.scale:
+            return True
+        self.degradations.append(step)
+        logger.warning(f"{self.remaining():.0f}s of the job's time budget left, degrading {step}.")
+        return False
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+def budget_allows(step):
+    """``TimeBudget.allows`` of the current job; True outside of a budgeted job."""
+    budget = _current_budget.get()
+    return budget is None or budget.allows(step)
+
+
+@contextmanager
+def time_budget(seconds, scale=None):
+    """Run the enclosed block of a job under a new TimeBudget."""
+    budget = TimeBudget(seconds, scale)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
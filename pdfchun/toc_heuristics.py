@@ -0,0 +1,102 @@
+import re
+
+# Lokale Bewertung von Seiten als Inhaltsverzeichnis, bevor das LLM gefragt wird
+
+TOC_KEYWORDS = re.compile(
+    r'\b(inhaltsverzeichnis|inhalt|inhaltsübersicht|contents|table of contents|sommaire|índice|indice)\b',
+    re.IGNORECASE
+)
+DOTTED_LEADER = re.compile(r'(\.\s?){4,}|…{2,}|_{4,}')
+TRAILING_PAGE_NUMBER = re.compile(r'(?:^|\s|\.)(\d{1,4}|[ivxlcdm]{1,6})$', re.IGNORECASE)
+NUMBERED_HEADING = re.compile(r'^(\d{1,2}(\.\d{1,2}){0,3}|[A-Z]|[IVX]{1,4})[.)]?\s+\S')
+
+MIN_LINES = 4
+
+
+def _trailing_number(line):
+    match = TRAILING_PAGE_NUMBER.search(line)
+    if not match or not match.group(1).isdigit():
+        return None
+    return int(match.group(1))
+
+
+def toc_page_features(page_text):
+    """Extract the layout features used by score_toc_page from a page's text."""
+    lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+    if not lines:
+        return None
+
+    numbers = [number for number in (_trailing_number(line) for line in lines) if number is not None]
+    ending_with_number = sum(1 for line in lines if TRAILING_PAGE_NUMBER.search(line))
+    ascending = sum(1 for previous, current in zip(numbers, numbers[1:]) if current > previous)
+
+    return {
+        "line_count": len(lines),
+        "page_number_ratio": ending_with_number / len(lines),
+        "dotted_leader_ratio": sum(1 for line in lines if DOTTED_LEADER.search(line)) / len(lines),
+        "numbered_heading_ratio": sum(1 for line in lines if NUMBERED_HEADING.match(line)) / len(lines),
+        "monotonic_ratio": ascending / (len(numbers) - 1) if len(numbers) > 2 else 0.0,
+        "has_keyword": bool(TOC_KEYWORDS.search(" ".join(lines[:5]))),
+        "mean_line_length": sum(len(line) for line in lines) / len(lines),
+    }
+
+
+def score_toc_page(page_text):
+    """Rate how likely a page is a table of contents, from 0.0 (no) to 1.0 (yes)."""
+    features = toc_page_features(page_text)
+    if features is None or features["line_count"] < MIN_LINES:
+        return 0.0
+
+    score = (
+        0.35 * min(1.0, features["page_number_ratio"] / 0.4)
+        + 0.20 * min(1.0, features["dotted_leader_ratio"] / 0.3)
+        + 0.10 * min(1.0, features["numbered_heading_ratio"] / 0.3)
+        + 0.20 * features["monotonic_ratio"]
+        + 0.15 * features["has_keyword"]
+    )
+
+    # Fließtext hat lange Zeilen, Inhaltsverzeichnisse kurze
+    if features["mean_line_length"] > 80:
+        score *= 0.5
+
+    return round(min(score, 1.0), 3)
+
+
+def classify_toc_page(page_text, reject_below, accept_above):
+    """Return True or False for clear cases and None for pages the LLM has to decide."""
+    score = score_toc_page(page_text)
+    if score < reject_below:
+        return False
+    if score >= accept_above:
+        return True
+    return None
+
+
+def evaluate_toc_scorer(samples, reject_below, accept_above):
+    """Measure the prefilter against labelled pages.
+
+    ``samples`` is a list of dicts with ``text`` and ``is_toc``. Ambiguous pages
+    are assumed to be decided correctly by the LLM, so precision and recall
+    describe the combined pipeline while ``llm_calls_saved`` counts the pages
+    the scorer settled on its own.
+    """
+    true_positive = false_positive = false_negative = llm_calls = 0
+    for sample in samples:
+        decision = classify_toc_page(sample["text"], reject_below, accept_above)
+        if decision is None:
+            llm_calls += 1
+            decision = sample["is_toc"]
+        if decision and sample["is_toc"]:
+            true_positive += 1
+        elif decision:
+            false_positive += 1
+        elif sample["is_toc"]:
+            false_negative += 1
+
+    return {
+        "pages": len(samples),
+        "precision": true_positive / (true_positive + false_positive) if true_positive + false_positive else 1.0,
+        "recall": true_positive / (true_positive + false_negative) if true_positive + false_negative else 1.0,
+        "llm_calls": llm_calls,
+        "llm_calls_saved": len(samples) - llm_calls,
+    }
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+
+import asyncpg
+
+logger = logging.getLogger('PDFLogger')
+
+CHANNEL = "topic_changed"
+
+NOTIFY_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION notify_topic_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{CHANNEL}', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'topic_changed_notify') THEN
+        CREATE TRIGGER topic_changed_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON topic
+        FOR EACH STATEMENT EXECUTE PROCEDURE notify_topic_changed();
+    END IF;
+END;
+$$;
+"""
+
+
+class TopicSnapshot:
+    """Immutable view of the topic table with its lookups built once per refresh.
+
+    Iterating yields ``(topic_id, topic)`` tuples like the rows of the table.
+    ``ids`` answers membership checks in constant time and ``categories`` is
+    the category list used in the classification prompts. Rows may carry a
+    third column with a description, kept in ``descriptions``.
+    """
+
+    def __init__(self, rows, version=0):
+        self.topics = tuple((int(row[0]), str(row[1])) for row in rows)
+        self.descriptions = {int(row[0]): str(row[2]) for row in rows if len(row) > 2 and row[2]}
+        self.names = dict(self.topics)
+        self.ids = frozenset(self.names)
+        self.categories = "\n".join(f"{topic_id}. {topic}" for topic_id, topic in self.topics)
+        self.version = version
+
+    def categories_for(self, topic_ids):
+        """Category list of the given topics only, in the given order."""
+        return "\n".join(f"{topic_id}. {self.names[topic_id]}" for topic_id in topic_ids)
+
+    def __iter__(self):
+        return iter(self.topics)
+
+    def __len__(self):
+        return len(self.topics)
+
+
+class TopicCatalog:
+    """In-process cache of the topic table.
+
+    The snapshot is reloaded after ``ttl_seconds`` or as soon as Postgres
+    reports a change on the ``topic_changed`` channel. The notifications come
+    from a statement trigger on ``topic`` that is installed on first use and
+    are received on a dedicated connection. Without that connection, for
+    example when the trigger cannot be created, the TTL alone applies.
+    """
+
+    def __init__(self, dsn, ttl_seconds, listen=True):
+        self.dsn = dsn
+        self.ttl_seconds = ttl_seconds
+        self.listen = listen
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._stale = False
+        self._listener = None
+        self._listen_attempted_at = None
+        self._loop = None
+        self._lock = None
+        self.refreshes = 0
+        self.notifications = 0
+
+    def invalidate(self, *_):
+        self._stale = True
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.notifications += 1
+        logger.info(f"Topic table changed ({payload}), reloading the topic catalog.")
+        self.invalidate()
+
+    def _on_listener_lost(self, connection):
+        # Während der Verbindungslücke könnten Änderungen verpasst worden sein
+        logger.warning("Topic change listener connection lost.")
+        self._listener = None
+        self.invalidate()
+
+    async def _start_listener(self, pool):
+        self._listen_attempted_at = time.monotonic()
+        try:
+            await pool.execute(NOTIFY_TRIGGER)
+            listener = await asyncpg.connect(self.dsn)
+            await listener.add_listener(CHANNEL, self._on_notify)
+            listener.add_termination_listener(self._on_listener_lost)
+            self._listener = listener
+            logger.info(f"Listening for topic changes on channel {CHANNEL}.")
+        except Exception as e:
+            logger.warning(f"Topic change notifications unavailable, relying on the TTL: {str(e)}")
+
+    async def get(self, pool):
+        """Return the current TopicSnapshot, reloading it from ``pool`` if needed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self.terminate()
+            self._snapshot = None
+            self._loop = loop
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self.listen and (self._listener is None or self._listener.is_closed()):
+                if self._listen_attempted_at is None or time.monotonic() - self._listen_attempted_at > self.ttl_seconds:
+                    await self._start_listener(pool)
+            if self._snapshot is None or self._stale or time.monotonic() - self._loaded_at > self.ttl_seconds:
+                await self._refresh(pool)
+        return self._snapshot
+
+    async def _refresh(self, pool):
+        self._stale = False
+        try:
+            # Die Spalte description ist optional; über to_jsonb ergibt sie sonst NULL
+            rows = await pool.fetch(
+                "SELECT t.topic_id, t.topic, to_jsonb(t) ->> 'description' AS description FROM topic t ORDER BY t.topic_id"
+            )
+        except Exception as e:
+            if self._snapshot is None:
+                raise
+            logger.error(f"Reloading topics failed, keeping {len(self._snapshot)} cached topics: {str(e)}")
+            return
+        self.refreshes += 1
+        self._snapshot = TopicSnapshot(rows, version=self.refreshes)
+        self._loaded_at = time.monotonic()
+        logger.info(f"Topic catalog loaded with {len(self._snapshot)} topics.")
+
+    def stats(self):
+        return {
+            "topics": len(self._snapshot) if self._snapshot else 0,
+            "refreshes": self.refreshes,
+            "notifications": self.notifications,
+            "listening": self._listener is not None and not self._listener.is_closed(),
+        }
+
+    def terminate(self):
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            self._listen_attempted_at = None
+            try:
+                listener.terminate()
+            except RuntimeError:
+                pass
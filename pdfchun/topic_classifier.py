@@ -0,0 +1,135 @@
+import logging
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+logger = logging.getLogger('PDFLogger')
+
+# Temperatur für die Umrechnung der Kosinus-Ähnlichkeiten in eine Konfidenz
+SOFTMAX_TEMPERATURE = 0.05
+
+
+class TopicClassifier:
+    """Local TF-IDF classifier over the topic table.
+
+    Each topic is represented by the centroid of its name and description and,
+    optionally, the texts of chunks already labelled with it. Character
+    n-grams make short topic names match German compounds in the chapter text.
+    The centroids stay sparse, so thousands of topics fit in memory.
+    """
+
+    def __init__(self, topics, labelled_texts=(), descriptions=None):
+        descriptions = descriptions or {}
+        self.topic_ids = [int(topic_id) for topic_id, _ in topics]
+        documents = [f"{name} {descriptions.get(int(topic_id), '')}".strip() for topic_id, name in topics]
+        labels = list(range(len(self.topic_ids)))
+
+        index = {topic_id: position for position, topic_id in enumerate(self.topic_ids)}
+        for text, topic_id in labelled_texts:
+            if topic_id in index:
+                documents.append(text)
+                labels.append(index[topic_id])
+
+        self.vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True, lowercase=True)
+        matrix = self.vectorizer.fit_transform(documents)
+
+        # Mittelwert je Thema als dünnbesetztes Produkt statt einer dichten Themen-x-Merkmale-Matrix
+        membership = sparse.csr_matrix(
+            (np.ones(len(labels)), (labels, np.arange(len(labels)))),
+            shape=(len(self.topic_ids), len(documents))
+        )
+        membership = sparse.diags(1.0 / np.asarray(membership.sum(axis=1)).ravel()) @ membership
+        self.centroids = normalize(membership @ matrix).tocsr()
+        logger.info(f"Topic classifier trained on {len(self.topic_ids)} topics and {len(documents) - len(self.topic_ids)} labelled texts.")
+
+    def similarities(self, text):
+        """Cosine similarity of ``text`` to every topic, in the order of ``topic_ids``."""
+        return self.centroids @ normalize(self.vectorizer.transform([text])).toarray().ravel()
+
+    def predict(self, text, similarities=None):
+        """Return ``{"topic_id", "confidence"}`` for the closest topic, or None without topics."""
+        if not self.topic_ids:
+            return None
+        if similarities is None:
+            similarities = self.similarities(text)
+        best = int(np.argmax(similarities))
+        if similarities[best] <= 0:
+            return {"topic_id": self.topic_ids[best], "confidence": 0.0}
+
+        weights = np.exp((similarities - similarities[best]) / SOFTMAX_TEMPERATURE)
+        return {
+            "topic_id": self.topic_ids[best],
+            "confidence": float(weights[best] / weights.sum())
+        }
+
+
+    def shortlist(self, text, k):
+        """Ids of the ``k`` topics most similar to ``text``, best first."""
+        similarities = self.similarities(text)
+        k = min(k, len(similarities))
+        if k <= 0:
+            return []
+        candidates = np.argpartition(-similarities, k - 1)[:k]
+        return [self.topic_ids[position] for position in candidates[np.argsort(-similarities[candidates])]]
+
+
+
+def evaluate_topic_classifier(topics, labelled_texts, thresholds, folds=2, ks=(), descriptions=None, groups=None):
+    """Compare local predictions with stored (LLM) labels using k-fold splits.
+
+    ``groups`` gives a key per labelled text, e.g. its book. All texts of a
+    group land in the same fold, so overlapping pieces of one chapter are
+    never split between training and test. Without it every text is its own
+    group.
+
+    For each threshold it reports how many chunks the local classifier would
+    decide on its own (``coverage``) and how often it agrees with the stored
+    label on those chunks (``agreement``). For each shortlist size in ``ks``
+    it reports ``recall_at_k``, the share of chunks whose stored topic is
+    among the ``k`` candidates sent to the LLM.
+    """
+    labelled_texts = list(labelled_texts)
+    groups = list(range(len(labelled_texts))) if groups is None else list(groups)
+    # Gruppen reihum in der Reihenfolge ihres ersten Auftretens auf die Folds verteilen
+    group_folds = {}
+    for group in groups:
+        group_folds.setdefault(group, len(group_folds) % folds)
+    sample_folds = [group_folds[group] for group in groups]
+    predictions = []
+    ranks = []
+    for fold in range(folds):
+        train = [sample for sample, sample_fold in zip(labelled_texts, sample_folds) if sample_fold != fold]
+        test = [sample for sample, sample_fold in zip(labelled_texts, sample_folds) if sample_fold == fold]
+        if not test:
+            continue
+        classifier = TopicClassifier(topics, train, descriptions)
+        positions = {topic_id: position for position, topic_id in enumerate(classifier.topic_ids)}
+        for text, topic_id in test:
+            similarities = classifier.similarities(text)
+            prediction = classifier.predict(text, similarities)
+            if prediction is not None:
+                predictions.append((prediction["confidence"], prediction["topic_id"] == topic_id))
+            if ks and topic_id in positions:
+                # Rang des gespeicherten Themas in der Vorauswahl, 1 = ähnlichstes Thema
+                ranks.append(int((similarities > similarities[positions[topic_id]]).sum()) + 1)
+
+    report = {
+        "chunks": len(predictions),
+        "overall_agreement": sum(match for _, match in predictions) / len(predictions) if predictions else None,
+        "thresholds": []
+    }
+    for threshold in thresholds:
+        covered = [match for confidence, match in predictions if confidence >= threshold]
+        report["thresholds"].append({
+            "threshold": threshold,
+            "coverage": len(covered) / len(predictions) if predictions else 0.0,
+            "agreement": sum(covered) / len(covered) if covered else None
+        })
+    if ks:
+        report["recall_at_k"] = {
+            str(k): sum(1 for rank in ranks if rank <= k) / len(ranks) if ranks else None
+            for k in ks
+        }
+    return report
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob.aio import BlobServiceClient
+
+logger = logging.getLogger(__name__)
+
+# Ein Client je Connection String und Event-Loop, geteilt von allen Funktionen des Workers
+_clients = {}
+
+
+def _create_client(connection_string):
+    connector = aiohttp.TCPConnector(
+        limit=int(os.getenv("BLOB_POOL_CONNECTIONS", "100")),
+        limit_per_host=int(os.getenv("BLOB_POOL_CONNECTIONS_PER_HOST", "50")),
+        keepalive_timeout=float(os.getenv("BLOB_KEEPALIVE_SECONDS", "60")),
+        ttl_dns_cache=300
+    )
+    session = aiohttp.ClientSession(connector=connector)
+    transport = AioHttpTransport(session=session, session_owner=False)
+    client = BlobServiceClient.from_connection_string(
+        connection_string,
+        transport=transport,
+        max_single_get_size=int(os.getenv("BLOB_MAX_SINGLE_GET_SIZE", str(4 * 1024 * 1024))),
+        max_chunk_get_size=int(os.getenv("BLOB_MAX_CHUNK_GET_SIZE", str(4 * 1024 * 1024)))
+    )
+    logger.info("Created shared async BlobServiceClient.")
+    return client, session, asyncio.ensure_future(_close_with_loop(client, session))
+
+
+async def _close_with_loop(client, session):
+    """Keep ``client`` open until its event loop shuts down, then close it.
+
+    ``asyncio.run`` cancels pending tasks before closing its loop, so the
+    connection pool is released on the loop it belongs to; afterwards it
+    could no longer be closed.
+    """
+    try:
+        await asyncio.Future()
+    finally:
+        await client.close()
+        await session.close()
+
+
+def get_blob_service_client(connection_string=None):
+    """Return the worker's shared ``azure.storage.blob.aio.BlobServiceClient``.
+
+    The client is created on first use and reuses one aiohttp connection pool
+    for all requests, so warm invocations skip TCP and TLS setup. Clients are
+    bound to the running event loop and recreated for a new one; each is
+    closed when its loop shuts down or by ``close_blob_clients``. Must be
+    called from a coroutine.
+    """
+    connection_string = connection_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if not connection_string:
+        raise ValueError("Azure Storage connection string is not set.")
+    loop = asyncio.get_running_loop()
+    key = (connection_string, loop)
+    entry = _clients.get(key)
+    if entry is None or entry[1].closed:
+        # Clients beendeter Loops wurden beim Herunterfahren ihrer Loop geschlossen
+        for stale_key in [k for k in _clients if k[1].is_closed() or _clients[k][1].closed]:
+            del _clients[stale_key]
+        entry = _create_client(connection_string)
+        _clients[key] = entry
+    return entry[0]
+
+
+async def close_blob_clients():
+    """Close the shared clients of the running event loop and their connection pools."""
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _clients if k[1] is loop]:
+        client, session, closer = _clients.pop(key)
+        closer.cancel()
+        try:
+            await closer
+        except asyncio.CancelledError:
+            pass
+        if not session.closed:
+            # Ein noch nicht gestarteter Task führt beim Abbrechen kein finally aus
+            await client.close()
+            await session.close()
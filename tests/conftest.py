@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Die Module von pdfchun importieren sich gegenseitig ohne Paketpräfix, wie in der Function App
+sys.path.append(os.path.join(ROOT, "pdfchun"))
+sys.path.append(ROOT)
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+# Datenbanktests laufen nur gegen eine ausdrücklich angegebene Wegwerf-Datenbank
+TEST_DSN = os.getenv("PDFCHUN_TEST_DSN")
+requires_db = pytest.mark.skipif(not TEST_DSN, reason="PDFCHUN_TEST_DSN is not set")
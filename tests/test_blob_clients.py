@@ -0,0 +1,89 @@
+import asyncio
+import os
+import socket
+
+import fitz
+from aiohttp import web
+
+from benchmarks.azurite_standin import connection_string, create_app
+from blob_download import open_blob_pdf
+from shared_code import blob_clients
+from shared_code.blob_clients import close_blob_clients, get_blob_service_client
+
+CONTAINER = "tests"
+
+
+async def with_standin(test):
+    """Run ``test(connection_string)`` against the Azurite stand-in served on this event loop."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    try:
+        conn_str = connection_string(sock.getsockname()[1])
+        await get_blob_service_client(conn_str).create_container(CONTAINER)
+        return await test(conn_str)
+    finally:
+        await close_blob_clients()
+        await runner.cleanup()
+
+
+def sample_pdf(pages):
+    document = fitz.open()
+    for page_num in range(pages):
+        document.new_page().insert_text((72, 72), f"Seite {page_num + 1} " + "Energie bleibt erhalten. " * 20)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def test_client_is_shared_within_a_loop():
+    async def test(conn_str):
+        client = get_blob_service_client(conn_str)
+        assert get_blob_service_client(conn_str) is client
+        blob = client.get_blob_client(CONTAINER, "hallo.txt")
+        await blob.upload_blob(b"hallo")
+        assert await (await blob.download_blob()).readall() == b"hallo"
+        session = blob_clients._clients[(conn_str, asyncio.get_running_loop())][1]
+        await close_blob_clients()
+        assert session.closed
+        assert get_blob_service_client(conn_str) is not client
+
+    asyncio.run(with_standin(test))
+
+
+def test_client_of_a_finished_loop_is_closed():
+    async def session_of_loop(conn_str):
+        get_blob_service_client(conn_str)
+        return blob_clients._clients[(conn_str, asyncio.get_running_loop())][1]
+
+    # Es wird keine Anfrage gesendet, der Stand-in ist nicht nötig
+    conn_str = connection_string(10000)
+    first = asyncio.run(session_of_loop(conn_str))
+    second = asyncio.run(session_of_loop(conn_str))
+    assert first is not second
+    assert first.closed and second.closed
+    # Der Eintrag der ersten Loop wurde beim Anlegen des zweiten Clients entfernt
+    assert len([key for key in blob_clients._clients if key[0] == conn_str]) == 1
+
+
+def test_open_blob_pdf_downloads_in_ranges(monkeypatch):
+    # Kleine Bereiche, damit der Download aus mehreren Range-Requests besteht
+    monkeypatch.setenv("BLOB_MAX_SINGLE_GET_SIZE", "4096")
+    monkeypatch.setenv("BLOB_MAX_CHUNK_GET_SIZE", "4096")
+    data = sample_pdf(40)
+    assert len(data) > 3 * 4096
+
+    async def test(conn_str):
+        blob = get_blob_service_client(conn_str).get_blob_client(CONTAINER, "buch.pdf")
+        await blob.upload_blob(data)
+        async with open_blob_pdf(blob, 4) as (path, document):
+            with open(path, "rb") as f:
+                assert f.read() == data
+            assert len(document) == 40
+            assert document[39].get_text().startswith("Seite 40")
+        return path
+
+    path = asyncio.run(with_standin(test))
+    assert not os.path.exists(path)
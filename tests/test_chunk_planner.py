@@ -0,0 +1,80 @@
+from chunk_planner import estimate_tokens, plan_pieces
+
+
+def book(pages=12, lines=40):
+    """``(page, text)`` pairs with numbered sentences, a paragraph break every 8 lines and a heading every 3 pages."""
+    texts = []
+    for page in range(pages):
+        lines_of_page = [f"{page // 3 + 1}.1 Abschnitt über Energie"] if page % 3 == 0 else []
+        for line in range(lines):
+            lines_of_page.append(f"Satz {page}-{line}: Die Energie eines abgeschlossenen Systems bleibt erhalten.")
+            if line % 8 == 7:
+                lines_of_page.append("")
+        texts.append((page, "\n".join(lines_of_page) + "\n"))
+    return texts
+
+
+def covered_spans(original, pieces):
+    """Start and end offset of every piece in ``original``, searching forward from the previous piece."""
+    spans, start = [], 0
+    for piece in pieces:
+        start = original.index(piece.text, start)
+        spans.append((start, start + len(piece.text)))
+        start += 1
+    return spans
+
+
+def test_pieces_cover_the_text_without_overlap():
+    texts = book()
+    pieces = list(plan_pieces(texts, 300))
+    assert len(pieces) > 1
+    assert "".join(piece.text for piece in pieces) == "".join(text for _, text in texts)
+
+
+def test_pieces_with_overlap_leave_no_gap():
+    texts = book()
+    original = "".join(text for _, text in texts)
+    pieces = list(plan_pieces(texts, 300, overlap_tokens=60))
+    spans = covered_spans(original, pieces)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(original)
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        assert start <= previous_end
+
+
+def test_pieces_stay_within_the_target():
+    for overlap in (0, 60):
+        for piece in plan_pieces(book(), 300, overlap_tokens=overlap):
+            assert estimate_tokens(piece.text) <= 300
+
+
+def test_long_lines_are_split():
+    texts = [(0, "Wort " * 2000 + "\n")]
+    pieces = list(plan_pieces(texts, 100))
+    assert "".join(piece.text for piece in pieces) == texts[0][1]
+    assert all(estimate_tokens(piece.text) <= 100 for piece in pieces)
+
+
+def test_page_numbers_follow_the_text():
+    texts = book()
+    pieces = list(plan_pieces(texts, 300, overlap_tokens=60))
+    assert pieces[0].start_page == 0
+    assert pieces[-1].end_page == len(texts) - 1
+    for piece, following in zip(pieces, pieces[1:]):
+        assert piece.start_page <= piece.end_page
+        assert piece.start_page <= following.start_page <= piece.end_page + 1
+
+
+def test_pieces_start_at_headings():
+    headings = [piece.heading for piece in plan_pieces(book(), 300, overlap_tokens=60) if piece.heading]
+    assert headings
+    assert all(heading.endswith("Abschnitt über Energie") for heading in headings)
+
+
+def test_without_target_everything_is_one_piece():
+    texts = book(pages=3)
+    pieces = list(plan_pieces(texts, 0))
+    assert len(pieces) == 1
+    assert pieces[0].text == "".join(text for _, text in texts)
+    assert (pieces[0].start_page, pieces[0].end_page) == (0, 2)
+    assert list(plan_pieces([], 0)) == []
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from conftest import TEST_DSN, requires_db
+from db_pool import DatabasePool
+
+BOOK_ID = 980100
+# Wie benchmarks/pipeline_bench.py: nur die Spalten, die ChunkWriter nicht selbst anlegt
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS book (book_id SERIAL PRIMARY KEY, title TEXT, url TEXT);
+CREATE TABLE IF NOT EXISTS chunk (
+    chunk_id SERIAL PRIMARY KEY,
+    book_id INTEGER,
+    startpage INTEGER,
+    endpage INTEGER,
+    is_relevant BOOLEAN,
+    chaptername TEXT,
+    content TEXT,
+    topic_id INTEGER,
+    relevance_percentage DOUBLE PRECISION,
+    usage_count INTEGER
+);
+"""
+
+
+async def with_writer_pool(test):
+    import pdfchun as P
+
+    previous, P.db_pool = P.db_pool, DatabasePool(TEST_DSN)
+    try:
+        await P.db_pool.execute(SCHEMA)
+        await P.db_pool.execute(
+            "INSERT INTO book (book_id, title) VALUES ($1, 'ChunkWriter test') ON CONFLICT (book_id) DO NOTHING", BOOK_ID
+        )
+        await P.ensure_chunk_columns()
+        await P.db_pool.execute("DELETE FROM chunk WHERE book_id = $1", BOOK_ID)
+        await test(P)
+    finally:
+        await P.db_pool.execute("DELETE FROM chunk WHERE book_id = $1", BOOK_ID)
+        await P.db_pool.execute("DELETE FROM book WHERE book_id = $1", BOOK_ID)
+        await P.db_pool.close()
+        P.db_pool = previous
+
+
+async def stored_contents(P):
+    rows = await P.db_pool.fetch("SELECT content FROM chunk WHERE book_id = $1 ORDER BY startpage", BOOK_ID)
+    return [row["content"] for row in rows]
+
+
+async def store_old_chunks(P):
+    writer = P.ChunkWriter(BOOK_ID)
+    writer.add(1, 2, True, "Kapitel 1", "alt 1", None, 0.0, 0)
+    writer.add(3, 4, True, "Kapitel 2", "alt 2", None, 0.0, 0)
+    assert await writer.flush() == 2
+
+
+@requires_db
+def test_failed_overwrite_keeps_the_old_chunks():
+    async def test(P):
+        await store_old_chunks(P)
+        writer = P.ChunkWriter(BOOK_ID, replace_existing=True)
+        writer.add(1, 4, True, "Kapitel 1", "neu", None, 0.0, 0)
+        # Eine ungültige Seitenzahl lässt den COPY nach dem DELETE scheitern
+        writer.add("keine Seite", 4, True, "Kapitel 2", "kaputt", None, 0.0, 0)
+        with pytest.raises(Exception):
+            await writer.flush()
+        assert await stored_contents(P) == ["alt 1", "alt 2"]
+
+    asyncio.run(with_writer_pool(test))
+
+
+@requires_db
+def test_overwrite_replaces_changed_chunks_and_keeps_unchanged_ones():
+    async def test(P):
+        writer = P.ChunkWriter(BOOK_ID)
+        writer.add(1, 2, True, "Kapitel 1", "alt 1", None, 0.0, 0, "fp-1")
+        writer.add(3, 4, True, "Kapitel 2", "alt 2", None, 0.0, 0, "fp-2")
+        await writer.flush()
+        writer = P.ChunkWriter(BOOK_ID, replace_existing=True)
+        writer.keep("fp-1", 5, 6)
+        writer.add(7, 8, True, "Kapitel 2", "neu 2", None, 0.0, 0, "fp-3")
+        assert await writer.flush() == 1
+        rows = await P.db_pool.fetch("SELECT startpage, content FROM chunk WHERE book_id = $1 ORDER BY startpage", BOOK_ID)
+        assert [(row["startpage"], row["content"]) for row in rows] == [(5, "alt 1"), (7, "neu 2")]
+
+    asyncio.run(with_writer_pool(test))
@@ -0,0 +1,51 @@
+import asyncio
+
+from conftest import TEST_DSN, requires_db
+from db_pool import DatabasePool
+from job_queue import claim_job, enqueue_job, ensure_job_schema
+
+# Ids oberhalb der Benchmark-Bücher (990000)
+BOOK_IDS = [980001, 980002, 980003]
+
+
+async def with_queue(test):
+    pool = DatabasePool(TEST_DSN)
+    try:
+        await ensure_job_schema(pool)
+        await pool.execute("DELETE FROM chunking_job WHERE book_id = ANY($1::int[])", BOOK_IDS)
+        await test(pool)
+    finally:
+        await pool.execute("DELETE FROM chunking_job WHERE book_id = ANY($1::int[])", BOOK_IDS)
+        await pool.close()
+
+
+@requires_db
+def test_claim_skips_locked_jobs():
+    async def test(pool):
+        first, _ = await enqueue_job(pool, BOOK_IDS[0])
+        second, _ = await enqueue_job(pool, BOOK_IDS[1])
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT 1 FROM chunking_job WHERE job_id = $1 FOR UPDATE", first)
+                # Ein blockierender Claim würde hier bis zum Ende der Transaktion warten
+                job = await asyncio.wait_for(claim_job(pool, "test-a", 60, 3), timeout=5)
+        assert job["job_id"] == second
+        job = await claim_job(pool, "test-b", 60, 3)
+        assert job["job_id"] == first
+
+    asyncio.run(with_queue(test))
+
+
+@requires_db
+def test_concurrent_claims_get_different_jobs():
+    async def test(pool):
+        for book_id in BOOK_IDS[:2]:
+            await enqueue_job(pool, book_id)
+        jobs = await asyncio.gather(*(claim_job(pool, f"test-{worker}", 60, 3) for worker in range(3)))
+        claimed = [job["job_id"] for job in jobs if job is not None]
+        assert len(claimed) == 2
+        assert len(set(claimed)) == 2
+        workers = await pool.fetch("SELECT worker_id FROM chunking_job WHERE book_id = ANY($1::int[])", BOOK_IDS)
+        assert len({row["worker_id"] for row in workers}) == 2
+
+    asyncio.run(with_queue(test))
@@ -0,0 +1,27 @@
+import json
+import os
+
+import pytest
+
+from conftest import FIXTURES
+from relevance import classify_page, detect_relevance
+
+with open(os.path.join(FIXTURES, "relevance_pages.json"), encoding="utf-8") as f:
+    PAGES = json.load(f)
+
+
+@pytest.mark.parametrize("page", PAGES, ids=[page["name"] for page in PAGES])
+def test_classify_page(page):
+    assert classify_page(page["text"]) == page["kind"]
+
+
+def test_content_pages_stay_relevant():
+    content = [page["text"] for page in PAGES if page["kind"] is None]
+    assert detect_relevance(content)["is_relevant"]
+
+
+def test_back_matter_chunk_is_irrelevant():
+    back_matter = [page["text"] for page in PAGES if page["kind"] is not None]
+    result = detect_relevance(back_matter)
+    assert not result["is_relevant"]
+    assert result["irrelevant_ratio"] == 1.0